@@ -1,4 +1,5 @@
-from flask import Flask
+import time
+from flask import Flask, current_app
 from flask_sqlalchemy import SQLAlchemy
 from flask_migrate import Migrate
 from flask_login import LoginManager
@@ -47,6 +48,13 @@ def create_app(config_class=Config):
     from app import commands
     commands.init_app(app)
 
+    from app.utils import resumenes, cache, instrumentacion, saldos, etiquetas
+    resumenes.init_app(app)
+    saldos.init_app(app)
+    etiquetas.init_app(app)
+    cache.init_app(app)
+    instrumentacion.init_app(app)
+
     from . import context_processors
     app.context_processor(context_processors.inject_config)
 
@@ -56,7 +64,7 @@ def create_app(config_class=Config):
     from app.models import (
         producto, cliente, venta, pago, venta_producto, usuario,
         tipo_producto, atributo, valor_atributo_producto, configuracion, gasto,
-        categoria_gasto, plan_pago, devolucion, devolucion_producto
+        categoria_gasto, plan_pago, devolucion, devolucion_producto, resumen_diario
     )
 
     return app
@@ -66,7 +74,35 @@ def create_app(config_class=Config):
 # User Loader para Flask-Login
 # -----------------------------------------------------------
 from app.models.usuario import Usuario
+from app.utils.cache import CacheResultados
+
+#Identidades ya cargadas, con el instante en que se comprobó su versión. Durante CACHE_USUARIOS_TTL segundos se
+#usan sin consultar la base de datos; después se consulta solo usuario.version: si otro proceso ha eliminado,
+#bloqueado o cambiado al usuario, la versión ya no coincide (o la fila no existe) y se vuelve a cargar.
+#Los cambios hechos en este mismo proceso descartan la entrada al confirmarse (dependencia 'usuario')
+cache_usuarios = CacheResultados(max_entradas=1024, ttl=3600)
 
 @login_manager.user_loader
 def load_user(user_id):
-    return Usuario.query.get(int(user_id))
\ No newline at end of file
+    user_id = int(user_id)
+    ahora = time.monotonic()
+    usuario, comprobado = cache_usuarios.obtener(user_id, (None, None))
+    if usuario is not None and ahora - comprobado < current_app.config['CACHE_USUARIOS_TTL']:
+        return db.session.merge(usuario, load=False)
+
+    if usuario is not None:
+        version = db.session.query(Usuario.version).filter(Usuario.id == user_id).scalar()
+        if version is None:
+            cache_usuarios.invalidar(user_id)
+            return None
+        if version != usuario.version:
+            usuario = None
+    if usuario is None:
+        usuario = db.session.get(Usuario, user_id)
+        if usuario is None:
+            return None
+        #Se guarda desvinculado de la sesión para que los commits no lo expiren
+        db.session.expunge(usuario)
+    cache_usuarios.guardar(user_id, (usuario, ahora), dependencias={'usuario'})
+    #Cada petición trabaja con su propia copia, sin volver a cargar la fila completa
+    return db.session.merge(usuario, load=False)
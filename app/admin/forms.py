@@ -27,7 +27,8 @@ class PagoForm(FlaskForm):
     submit = SubmitField('Registrar Pago')
 
 class AgregarProductoVentaForm(FlaskForm):
-    producto = SelectField('Producto', coerce=int, validators=[DataRequired()])
+    #Id del producto elegido con el buscador (admin.buscar_productos)
+    producto = IntegerField('Producto', validators=[DataRequired()])
     cantidad = IntegerField('Cantidad', validators=[DataRequired(), NumberRange(min=1)], default=1)
     submit = SubmitField('Añadir Producto')
 
@@ -1,14 +1,16 @@
 import os
-from flask import render_template, redirect, url_for, flash, request, current_app, jsonify
+import glob
+from flask import render_template, redirect, url_for, flash, request, current_app, jsonify, send_file, abort
 from flask_login import login_required, current_user
-from sqlalchemy import func, or_, cast, Date
-from datetime import datetime, timedelta
+from sqlalchemy import func, or_, select, type_coerce
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import joinedload, selectinload
+from datetime import datetime, date, timedelta
 from werkzeug.utils import secure_filename
+import io
 import uuid
 from math import isclose
 from decimal import Decimal
-from weasyprint import HTML, CSS
-from pdf2image import convert_from_bytes
 
 #Importaciones de WTForms
 from flask_wtf import FlaskForm
@@ -19,9 +21,12 @@ from wtforms.validators import DataRequired, NumberRange
 from app import db
 from app.admin import bp
 from app.utils.decorators import admin_required
+from app.utils.cache import CacheResultados
+from app.utils.paginacion import paginar_por_cursor
+from app.utils import busqueda, documentos, exportacion
 
 #Importación de todos los Modelos
-from app.models.producto import Producto
+from app.models.producto import Producto, modo_atributos
 from app.models.cliente import Cliente
 from app.models.venta import Venta
 from app.models.pago import Pago
@@ -36,6 +41,7 @@ from app.models.categoria_gasto import CategoriaGasto
 from app.models.plan_pago import PlanPago
 from app.models.devolucion import Devolucion
 from app.models.devolucion_producto import DevolucionProducto
+from app.models.resumen_diario import ResumenVentaDiaria, ResumenProductoDiario, ResumenGastoDiario
 
 #Importación de todos los Formularios
 from app.admin.forms import (
@@ -92,10 +98,37 @@ def _calcular_plan_de_pagos(monto_venta, abono_inicial, numero_cuotas, frecuenci
     return plan_pagos
 
 
+#Filtros y cursores comunes a los listados paginados
+POR_PAGINA = 50
+
+def _filtros_listado():
+    """Parámetros de la petición que se conservan al cambiar de página."""
+    return {k: v for k, v in request.args.items() if v and k not in ('antes', 'despues')}
+
+def _paginar(query, columnas, descendente=True):
+    return paginar_por_cursor(
+        query, columnas,
+        despues=request.args.get('despues'),
+        antes=request.args.get('antes'),
+        por_pagina=POR_PAGINA,
+        descendente=descendente
+    )
+
+def _filtrar_por_fechas(query, columna):
+    desde = request.args.get('desde', type=date.fromisoformat)
+    hasta = request.args.get('hasta', type=date.fromisoformat)
+    if desde:
+        query = query.filter(columna >= datetime.combine(desde, datetime.min.time()))
+    if hasta:
+        query = query.filter(columna < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    return query
+
+
 @bp.route('/configuracion', methods=['GET', 'POST'])
 @admin_required
 def configuracion_tienda():
-    config = Configuracion.obtener_config()
+    #Se edita la fila real; obtener_config() solo devuelve una copia de lectura
+    config = Configuracion.query.order_by(Configuracion.id).first()
     if not config:
         config = Configuracion()
         db.session.add(config)
@@ -116,7 +149,9 @@ def configuracion_tienda():
             logo_file.save(filepath)
             config.logo_path = f'uploads/logos/{filename}'
 
+        config.marcar_cambio()
         db.session.commit()
+        Configuracion.invalidar_cache()
         flash('La configuración de la tienda ha sido actualizada.', 'success')
         return redirect(url_for('admin.configuracion_tienda'))
 
@@ -125,7 +160,7 @@ def configuracion_tienda():
 @bp.route('/configuracion/intereses', methods=['GET', 'POST'])
 @admin_required
 def configuracion_intereses():
-    config = Configuracion.obtener_config()
+    config = Configuracion.query.order_by(Configuracion.id).first()
     if not config:
         #En el caso improbable de que no exista, la creamos
         config = Configuracion()
@@ -137,7 +172,9 @@ def configuracion_intereses():
         config.interes_diario = form.interes_diario.data
         config.interes_semanal = form.interes_semanal.data
         config.interes_mensual = form.interes_mensual.data
+        config.marcar_cambio()
         db.session.commit()
+        Configuracion.invalidar_cache()
         flash('Las tasas de interés han sido actualizadas exitosamente.', 'success')
         return redirect(url_for('admin.configuracion_intereses'))
 
@@ -154,103 +191,183 @@ def before_request():
 
 
 # -----------------------------------------------------------------------------
-# --- RUTA PRINCIPAL DEL DASHBOARD ---
+# --- WIDGETS DEL DASHBOARD (CON CACHÉ) ---
 # -----------------------------------------------------------------------------
-@bp.route('/dashboard')
-@login_required
-def dashboard():
-    # Fechas de referencia
-    hoy_inicio = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-    hace_30_dias = datetime.utcnow() - timedelta(days=30)
+#Caché de los resultados de cada widget; se invalida al confirmar cambios en las tablas de las que depende
+cache_dashboard = CacheResultados(max_entradas=128)
+
+ESTADOS_VENTA = ['En Proceso', 'Pendiente', 'Pagada', 'Credito', 'Con Devolucion', 'Anulada']
+ESTADOS_INGRESO = ['Pagada', 'Credito', 'Con Devolucion']
+ESTADOS_VENTA_ACTIVA = ['Pagada', 'Pendiente', 'Credito', 'Con Devolucion']
 
-    # --- CÁLCULOS FINANCIEROS CLAROS ---
+def _widget_resumen_financiero(desde, hasta):
+    # Todas las cifras salen de las tablas de resumen diario (ver app/utils/resumenes.py)
 
     # 1. INGRESOS BRUTOS (Total de ventas finalizadas en el período)
-    ingresos_brutos_mes = db.session.query(func.sum(Venta.monto_total)).filter(
-        Venta.fecha_venta >= hace_30_dias,
-        Venta.estado.in_(['Pagada', 'Credito', 'Con Devolucion'])
+    ingresos_brutos = db.session.query(func.sum(ResumenVentaDiaria.monto_total)).filter(
+        ResumenVentaDiaria.dia.between(desde, hasta),
+        ResumenVentaDiaria.estado.in_(ESTADOS_INGRESO)
     ).scalar() or Decimal('0.0')
 
     # 2. REEMBOLSOS (Total de dinero devuelto a clientes, registrado como gasto)
-    reembolsos_mes = db.session.query(func.sum(Gasto.monto)).join(CategoriaGasto).filter(
-        Gasto.fecha >= hace_30_dias,
+    reembolsos = db.session.query(func.sum(ResumenGastoDiario.monto_total)).join(
+        CategoriaGasto, ResumenGastoDiario.categoria_id == CategoriaGasto.id
+    ).filter(
+        ResumenGastoDiario.dia.between(desde, hasta),
         CategoriaGasto.nombre == 'Devoluciones'
     ).scalar() or Decimal('0.0')
 
-    # 3. INGRESOS NETOS (Lo que realmente queda después de devoluciones)
-    ingresos_netos_mes = ingresos_brutos_mes - reembolsos_mes
-
-    # 4. GASTOS OPERATIVOS (Todos los gastos EXCEPTO devoluciones)
-    gastos_operativos_mes = db.session.query(func.sum(Gasto.monto)).join(CategoriaGasto).filter(
-        Gasto.fecha >= hace_30_dias,
+    # 3. GASTOS OPERATIVOS (Todos los gastos EXCEPTO devoluciones)
+    gastos_operativos = db.session.query(func.sum(ResumenGastoDiario.monto_total)).join(
+        CategoriaGasto, ResumenGastoDiario.categoria_id == CategoriaGasto.id
+    ).filter(
+        ResumenGastoDiario.dia.between(desde, hasta),
         CategoriaGasto.nombre != 'Devoluciones'
     ).scalar() or Decimal('0.0')
 
-    # 5. BENEFICIO NETO (La ganancia final)
-    beneficio_neto_mes = ingresos_netos_mes - gastos_operativos_mes
+    # 4. INGRESOS NETOS y 5. BENEFICIO NETO
+    ingresos_netos = ingresos_brutos - reembolsos
+    return {
+        'ingresos_brutos': ingresos_brutos,
+        'reembolsos': reembolsos,
+        'ingresos_netos': ingresos_netos,
+        'gastos_operativos': gastos_operativos,
+        'beneficio_neto': ingresos_netos - gastos_operativos
+    }
 
-    # Métricas del día (para vista rápida)
-    ingresos_hoy = db.session.query(func.sum(Venta.monto_total)).filter(
-        Venta.fecha_venta >= hoy_inicio,
-        Venta.estado.in_(['Pagada', 'Pendiente', 'Credito', 'Con Devolucion'])
-    ).scalar() or Decimal('0.0')
-    ventas_hoy = Venta.query.filter(
-        Venta.fecha_venta >= hoy_inicio,
-        Venta.estado.in_(['Pagada', 'Pendiente', 'Credito', 'Con Devolucion'])
-    ).count()
-
-    # Gráfico de ventas (basado en Ingresos Brutos)
-    ventas_por_dia = db.session.query(
-        cast(Venta.fecha_venta, Date).label('dia'),
-        func.sum(Venta.monto_total).label('total_vendido')
+def _widget_hoy(hoy):
+    ingresos, ventas = db.session.query(
+        func.sum(ResumenVentaDiaria.monto_total),
+        func.sum(ResumenVentaDiaria.numero_ventas)
     ).filter(
-        Venta.fecha_venta >= hace_30_dias,
-        Venta.estado.in_(['Pagada', 'Pendiente', 'Credito', 'Con Devolucion'])
-    ).group_by('dia').order_by('dia').all()
-    chart_labels = [venta.dia.strftime('%d %b') for venta in ventas_por_dia]
-    chart_data = [float(venta.total_vendido) for venta in ventas_por_dia]
-
-    # Consultas "Top 5"
-    top_productos = db.session.query(
-        Producto,
-        func.sum(VentaProducto.cantidad).label('total_cantidad')
-    ).join(VentaProducto).join(Venta).filter(
-        Venta.fecha_venta >= hace_30_dias,
-        Venta.estado.in_(['Pagada', 'Pendiente','Credito', 'Con Devolucion'])
-    ).group_by(Producto.id).order_by(func.sum(VentaProducto.cantidad).desc()).limit(5).all()
-
-    top_clientes = db.session.query(
-        Cliente,
-        func.sum(Venta.monto_total).label('total_gastado')
+        ResumenVentaDiaria.dia == hoy,
+        ResumenVentaDiaria.estado.in_(ESTADOS_VENTA_ACTIVA)
+    ).one()
+    return {'ingresos': ingresos or Decimal('0.0'), 'ventas': ventas or 0}
+
+def _widget_ventas_por_dia(desde, hasta):
+    filas = db.session.query(
+        ResumenVentaDiaria.dia,
+        func.sum(ResumenVentaDiaria.monto_total)
+    ).filter(
+        ResumenVentaDiaria.dia.between(desde, hasta),
+        ResumenVentaDiaria.estado.in_(ESTADOS_VENTA_ACTIVA)
+    ).group_by(ResumenVentaDiaria.dia).order_by(ResumenVentaDiaria.dia).all()
+    return [(dia, total) for dia, total in filas]
+
+def _widget_top_productos(desde, hasta):
+    filas = db.session.query(
+        Producto.id,
+        Producto.nombre,
+        func.sum(ResumenProductoDiario.cantidad)
+    ).join(ResumenProductoDiario, ResumenProductoDiario.producto_id == Producto.id).filter(
+        ResumenProductoDiario.dia.between(desde, hasta),
+        ResumenProductoDiario.estado.in_(ESTADOS_VENTA_ACTIVA)
+    ).group_by(Producto.id, Producto.nombre).order_by(func.sum(ResumenProductoDiario.cantidad).desc()).limit(5).all()
+    return [{'id': id, 'nombre': nombre, 'total_cantidad': total} for id, nombre, total in filas]
+
+def _widget_top_clientes(desde, hasta):
+    # Los clientes no tienen resumen propio; el índice sobre fecha_venta acota la consulta
+    filas = db.session.query(
+        Cliente.id,
+        Cliente.nombre,
+        Cliente.apellido,
+        func.sum(Venta.monto_total)
     ).join(Venta).filter(
-        Venta.fecha_venta >= hace_30_dias,
-        Venta.estado.in_(['Pagada', 'Pendiente','Credito', 'Con Devolucion'])
-    ).group_by(Cliente.id).order_by(func.sum(Venta.monto_total).desc()).limit(5).all()
-
-    top_categorias_gasto = db.session.query(
+        Venta.fecha_venta >= datetime.combine(desde, datetime.min.time()),
+        Venta.fecha_venta < datetime.combine(hasta + timedelta(days=1), datetime.min.time()),
+        Venta.estado.in_(ESTADOS_VENTA_ACTIVA)
+    ).group_by(Cliente.id, Cliente.nombre, Cliente.apellido).order_by(func.sum(Venta.monto_total).desc()).limit(5).all()
+    return [{'id': id, 'nombre': f"{nombre} {apellido or ''}".strip(), 'total_gastado': total}
+            for id, nombre, apellido, total in filas]
+
+def _widget_top_categorias_gasto(desde, hasta):
+    filas = db.session.query(
         CategoriaGasto.nombre,
-        func.sum(Gasto.monto).label('total_gastado')
-    ).join(Gasto).filter(
-        Gasto.fecha >= hace_30_dias
-    ).group_by(CategoriaGasto.nombre).order_by(func.sum(Gasto.monto).desc()).limit(5).all()
+        func.sum(ResumenGastoDiario.monto_total)
+    ).join(ResumenGastoDiario, ResumenGastoDiario.categoria_id == CategoriaGasto.id).filter(
+        ResumenGastoDiario.dia.between(desde, hasta)
+    ).group_by(CategoriaGasto.nombre).order_by(func.sum(ResumenGastoDiario.monto_total).desc()).limit(5).all()
+    return [{'nombre': nombre, 'total_gastado': total} for nombre, total in filas]
+
+def _widget_productos_bajo_stock():
+    filas = db.session.query(Producto.id, Producto.nombre, Producto.stock).filter(
+        Producto.stock <= 5
+    ).order_by(Producto.stock.asc()).limit(5).all()
+    return [{'id': id, 'nombre': nombre, 'stock': stock} for id, nombre, stock in filas]
+
+#Widget -> (función, tablas de las que depende su resultado)
+WIDGETS_DASHBOARD = {
+    'resumen_financiero': (_widget_resumen_financiero, {'venta', 'gasto', 'categoria_gasto'}),
+    'hoy': (_widget_hoy, {'venta'}),
+    'ventas_por_dia': (_widget_ventas_por_dia, {'venta'}),
+    'top_productos': (_widget_top_productos, {'venta', 'venta_producto', 'producto'}),
+    'top_clientes': (_widget_top_clientes, {'venta', 'cliente'}),
+    'top_categorias_gasto': (_widget_top_categorias_gasto, {'gasto', 'categoria_gasto'}),
+    'productos_bajo_stock': (_widget_productos_bajo_stock, {'producto'}),
+}
+
+def _obtener_widget(nombre, *args):
+    funcion, dependencias = WIDGETS_DASHBOARD[nombre]
+    return cache_dashboard.obtener_o_calcular(
+        (nombre,) + args,
+        lambda: funcion(*args),
+        dependencias=dependencias,
+        ttl=current_app.config['CACHE_DASHBOARD_TTL']
+    )
 
-    productos_bajo_stock = Producto.query.filter(Producto.stock <= 5).order_by(Producto.stock.asc()).limit(5).all()
 
+def _serializar_widget(valor):
+    if isinstance(valor, dict):
+        return {clave: _serializar_widget(v) for clave, v in valor.items()}
+    if isinstance(valor, (list, tuple)):
+        return [_serializar_widget(v) for v in valor]
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, date):
+        return valor.isoformat()
+    return valor
+
+def _rango_dashboard():
+    """Lee ?desde=YYYY-MM-DD&hasta=YYYY-MM-DD; por defecto, los últimos 30 días."""
+    hasta = request.args.get('hasta', type=date.fromisoformat) or datetime.utcnow().date()
+    desde = request.args.get('desde', type=date.fromisoformat) or hasta - timedelta(days=30)
+    return desde, hasta
+
+
+# -----------------------------------------------------------------------------
+# --- RUTA PRINCIPAL DEL DASHBOARD ---
+# -----------------------------------------------------------------------------
+@bp.route('/dashboard')
+@login_required
+def dashboard():
+    #La página se sirve vacía; cada bloque se carga desde api_dashboard_widget
+    desde, hasta = _rango_dashboard()
     return render_template('admin/dashboard.html',
                            titulo='Dashboard Analítico',
-                           ingresos_brutos_mes=ingresos_brutos_mes,
-                           reembolsos_mes=reembolsos_mes,
-                           ingresos_netos_mes=ingresos_netos_mes,
-                           gastos_operativos_mes=gastos_operativos_mes,
-                           beneficio_neto_mes=beneficio_neto_mes,
-                           ingresos_hoy=ingresos_hoy,
-                           ventas_hoy=ventas_hoy,
-                           chart_labels=chart_labels,
-                           chart_data=chart_data,
-                           top_productos=top_productos,
-                           top_clientes=top_clientes,
-                           top_categorias_gasto=top_categorias_gasto,
-                           productos_bajo_stock=productos_bajo_stock)
+                           desde=desde,
+                           hasta=hasta,
+                           widgets=list(WIDGETS_DASHBOARD))
+
+@bp.route('/api/dashboard/<widget>')
+@login_required
+def api_dashboard_widget(widget):
+    if widget not in WIDGETS_DASHBOARD:
+        return jsonify({'error': 'Widget desconocido'}), 404
+
+    desde, hasta = _rango_dashboard()
+    if desde > hasta:
+        return jsonify({'error': 'La fecha inicial no puede ser posterior a la final'}), 400
+
+    if widget == 'hoy':
+        datos = _obtener_widget(widget, datetime.utcnow().date())
+    elif widget == 'productos_bajo_stock':
+        datos = _obtener_widget(widget)
+    else:
+        datos = _obtener_widget(widget, desde, hasta)
+
+    return jsonify({'widget': widget, 'desde': desde.isoformat(), 'hasta': hasta.isoformat(),
+                    'datos': _serializar_widget(datos)})
 
 @bp.route('/')
 @login_required
@@ -261,11 +378,153 @@ def index():
 # -----------------------------------------------------------------------------
 # --- FLUJO DE GESTIÓN DE PRODUCTOS CON ATRIBUTOS DINÁMICOS ---
 # -----------------------------------------------------------------------------
+#Clase de formulario de cada tipo de producto, por (tipo_id, version_esquema): la versión cambia cuando
+#otro proceso modifica los atributos, y los commits de este proceso además descartan la entrada
+cache_formularios_producto = CacheResultados(max_entradas=128, ttl=3600)
+
+
+def _construir_formulario_producto(tipo):
+    class DynamicProductForm(FlaskForm):
+        nombre = StringField('Nombre del Producto', validators=[DataRequired()])
+        descripcion = TextAreaField('Descripción')
+        precio = DecimalField('Precio', validators=[DataRequired(), NumberRange(min=0)])
+        stock = IntegerField('Stock Disponible', validators=[DataRequired(), NumberRange(min=0)])
+
+    atributos = tipo.atributos.all()
+    #Las opciones de todos los atributos de selección en una sola consulta
+    opciones = {}
+    for opcion in OpcionAtributo.query.filter(
+        OpcionAtributo.atributo_id.in_([a.id for a in atributos if a.tipo_campo == 'Seleccion'])
+    ).order_by(OpcionAtributo.id):
+        opciones.setdefault(opcion.atributo_id, []).append((opcion.valor_opcion, opcion.valor_opcion))
+
+    atributo_ids = []
+    for atributo in atributos:
+        field_name = f'attr_{atributo.id}'
+        validators = [DataRequired()]
+        field = None
+
+        if atributo.tipo_campo == 'Texto':
+            field = StringField(atributo.nombre_atributo, validators=validators)
+        elif atributo.tipo_campo == 'Numero':
+            field = IntegerField(atributo.nombre_atributo, validators=validators)
+        elif atributo.tipo_campo == 'Seleccion':
+            field = SelectField(atributo.nombre_atributo, choices=opciones.get(atributo.id, []), validators=validators)
+
+        if field:
+            setattr(DynamicProductForm, field_name, field)
+            atributo_ids.append(atributo.id)
+
+    #Ids de los atributos con campo en el formulario, en el orden del tipo
+    DynamicProductForm.atributo_ids = tuple(atributo_ids)
+    return DynamicProductForm
+
+
+def _formulario_producto(tipo):
+    """Clase de formulario (FlaskForm) con un campo attr_<id> por cada atributo del tipo de producto."""
+    return cache_formularios_producto.obtener_o_calcular(
+        (tipo.id, tipo.version_esquema),
+        lambda: _construir_formulario_producto(tipo),
+        dependencias={'atributo', 'opcion_atributo'}
+    )
+
+
+def _filtro_atributo(atributo_id, valores):
+    if modo_atributos() == 'json':
+        if db.session.get_bind().dialect.name == 'postgresql':
+            #Contención JSONB (@>), que resuelve el índice GIN ix_producto_atributos_json
+            columna = type_coerce(Producto.atributos_json, JSONB)
+            return or_(*[columna.contains({str(atributo_id): valor}) for valor in valores])
+        return Producto.atributos_json[str(atributo_id)].as_string().in_(valores)
+    return Producto.id.in_(
+        db.session.query(ValorAtributoProducto.producto_id).filter(
+            ValorAtributoProducto.atributo_id == atributo_id,
+            ValorAtributoProducto.valor.in_(valores)
+        )
+    )
+
+
+def _conteo_opciones(filtros_base, filtros_atributos, atributo_ids):
+    """{atributo_id: {valor: nº de productos}} sobre los productos que cumplen los filtros."""
+    conteos = {}
+    if modo_atributos() == 'json':
+        #Se agrupa por el valor extraído de la propia fila de producto, sin unir valor_atributo_producto
+        for atributo_id in atributo_ids:
+            valor = Producto.atributos_json[str(atributo_id)].as_string()
+            filas = db.session.query(valor, func.count(Producto.id)).filter(
+                *filtros_base, *filtros_atributos, valor.isnot(None)
+            ).group_by(valor).all()
+            conteos[atributo_id] = dict(filas)
+        return conteos
+
+    productos_filtrados = db.session.query(Producto.id).filter(*filtros_base, *filtros_atributos)
+    filas = db.session.query(
+        ValorAtributoProducto.atributo_id, ValorAtributoProducto.valor, func.count(ValorAtributoProducto.producto_id)
+    ).filter(
+        ValorAtributoProducto.atributo_id.in_(atributo_ids),
+        ValorAtributoProducto.producto_id.in_(productos_filtrados)
+    ).group_by(ValorAtributoProducto.atributo_id, ValorAtributoProducto.valor).all()
+    for atributo_id, valor, cantidad in filas:
+        conteos.setdefault(atributo_id, {})[valor] = cantidad
+    return conteos
+
+
 @bp.route('/productos')
 def listar_productos():
-    productos = Producto.query.order_by(Producto.nombre).all()
+    tipos = TipoProducto.query.order_by(TipoProducto.nombre).all()
+    tipo_id = request.args.get('tipo', type=int)
+    tipo = TipoProducto.query.get(tipo_id) if tipo_id else None
+
+    filtros_base = []
+    if tipo:
+        filtros_base.append(Producto.tipo_producto_id == tipo.id)
+    if request.args.get('con_stock', type=int):
+        filtros_base.append(Producto.stock > 0)
+
+    #Búsqueda de texto en nombre, descripción y atributos; los resultados se ordenan por relevancia
+    q = request.args.get('q', '', type=str).strip()
+    coincidencias = busqueda.buscar_productos_texto(q) if q else None
+    if coincidencias is not None:
+        filtros_base.append(Producto.id.in_(select(coincidencias.c.id)))
+
+    #Facetas: attr_<id>=valor (se puede repetir); varios valores del mismo atributo se combinan con O,
+    #atributos distintos con Y
+    atributos = tipo.atributos.all() if tipo else []
+    seleccion = {}
+    for atributo in atributos:
+        valores = [v for v in request.args.getlist(f'attr_{atributo.id}') if v]
+        if valores:
+            seleccion[atributo.id] = valores
+    filtros_atributos = {atributo_id: _filtro_atributo(atributo_id, valores) for atributo_id, valores in seleccion.items()}
+
+    query = Producto.query.options(joinedload(Producto.tipo_producto)).filter(*filtros_base, *filtros_atributos.values())
+    if coincidencias is not None:
+        query = query.join(coincidencias, coincidencias.c.id == Producto.id).order_by(coincidencias.c.rango, Producto.nombre)
+    else:
+        query = query.order_by(Producto.nombre)
+    productos = query.all()
+
+    #Conteos por opción: los atributos sin selección se cuentan sobre el resultado actual; los que tienen
+    #selección, sin su propio filtro, para que se vean las alternativas disponibles
+    conteos = {}
+    if atributos:
+        sin_seleccion = [a.id for a in atributos if a.id not in seleccion]
+        if sin_seleccion:
+            conteos.update(_conteo_opciones(filtros_base, list(filtros_atributos.values()), sin_seleccion))
+        for atributo_id in seleccion:
+            otros = [f for otro_id, f in filtros_atributos.items() if otro_id != atributo_id]
+            conteos.update(_conteo_opciones(filtros_base, otros, [atributo_id]))
+
+    facetas = []
+    for atributo in atributos:
+        #Una opción marcada sigue visible aunque otros filtros la dejen sin productos
+        opciones = {valor: 0 for valor in seleccion.get(atributo.id, [])}
+        opciones.update(conteos.get(atributo.id, {}))
+        facetas.append({'atributo': atributo, 'opciones': sorted(opciones.items()), 'seleccion': seleccion.get(atributo.id, [])})
+
     form = EmptyForm() # Para el token CSRF del botón de eliminar
-    return render_template('admin/productos.html', productos=productos, form=form)
+    return render_template('admin/productos.html', productos=productos, form=form, tipos=tipos, tipo=tipo,
+                           facetas=facetas, con_stock=request.args.get('con_stock', type=int), q=q)
 
 @bp.route('/productos/seleccionar-tipo', methods=['GET', 'POST'])
 @admin_required
@@ -290,28 +549,8 @@ def seleccionar_tipo_producto():
 def crear_producto_dinamico(tipo_id):
     tipo = TipoProducto.query.get_or_404(tipo_id)
 
-    #Construcción dinámica del formulario
-    class DynamicProductForm(FlaskForm):
-        nombre = StringField('Nombre del Producto', validators=[DataRequired()])
-        descripcion = TextAreaField('Descripción')
-        precio = DecimalField('Precio', validators=[DataRequired(), NumberRange(min=0)])
-        stock = IntegerField('Stock Disponible', validators=[DataRequired(), NumberRange(min=0)])
-
-    for atributo in tipo.atributos:
-        field_name = f'attr_{atributo.id}'
-        validators = [DataRequired()]
-        field = None
-
-        if atributo.tipo_campo == 'Texto':
-            field = StringField(atributo.nombre_atributo, validators=validators)
-        elif atributo.tipo_campo == 'Numero':
-            field = IntegerField(atributo.nombre_atributo, validators=validators)
-        elif atributo.tipo_campo == 'Seleccion':
-            choices = [(op.valor_opcion, op.valor_opcion) for op in atributo.opciones]
-            field = SelectField(atributo.nombre_atributo, choices=choices, validators=validators)
-
-        if field:
-            setattr(DynamicProductForm, field_name, field)
+    #Formulario dinámico según los atributos del tipo (cacheado por proceso)
+    DynamicProductForm = _formulario_producto(tipo)
 
     form = DynamicProductForm()
 
@@ -323,19 +562,10 @@ def crear_producto_dinamico(tipo_id):
             stock=form.stock.data,
             tipo_producto_id=tipo.id
         )
+        nuevo_producto.guardar_valores_atributos(
+            {atributo_id: form[f'attr_{atributo_id}'].data for atributo_id in DynamicProductForm.atributo_ids}
+        )
         db.session.add(nuevo_producto)
-        db.session.flush()
-
-        for atributo in tipo.atributos:
-            field_name = f'attr_{atributo.id}'
-            valor_data = form[field_name].data
-            valor_atributo = ValorAtributoProducto(
-                valor=str(valor_data),
-                producto_id=nuevo_producto.id,
-                atributo_id=atributo.id
-            )
-            db.session.add(valor_atributo)
-
         db.session.commit()
         flash('Producto creado exitosamente.', 'success')
         return redirect(url_for('admin.listar_productos'))
@@ -347,28 +577,7 @@ def crear_producto_dinamico(tipo_id):
 def editar_producto(id):
     producto = Producto.query.get_or_404(id)
     tipo = producto.tipo_producto
-
-    class DynamicProductForm(FlaskForm):
-        nombre = StringField('Nombre del Producto', validators=[DataRequired()])
-        descripcion = TextAreaField('Descripción')
-        precio = DecimalField('Precio', validators=[DataRequired(), NumberRange(min=0)])
-        stock = IntegerField('Stock Disponible', validators=[DataRequired(), NumberRange(min=0)])
-
-    for atributo in tipo.atributos:
-        field_name = f'attr_{atributo.id}'
-        validators = [DataRequired()]
-        field = None
-
-        if atributo.tipo_campo == 'Texto':
-            field = StringField(atributo.nombre_atributo, validators=validators)
-        elif atributo.tipo_campo == 'Numero':
-            field = IntegerField(atributo.nombre_atributo, validators=validators)
-        elif atributo.tipo_campo == 'Seleccion':
-            choices = [(op.valor_opcion, op.valor_opcion) for op in atributo.opciones]
-            field = SelectField(atributo.nombre_atributo, choices=choices, validators=validators)
-
-        if field:
-            setattr(DynamicProductForm, field_name, field)
+    DynamicProductForm = _formulario_producto(tipo)
 
     form = DynamicProductForm(obj=producto)
 
@@ -379,43 +588,22 @@ def editar_producto(id):
         producto.precio = form.precio.data
         producto.stock = form.stock.data
 
-        #Actualizar los valores de los atributos dinámicos
-        for atributo in tipo.atributos:
-            field_name = f'attr_{atributo.id}'
-            valor_data = form[field_name].data
-
-            #Busca el valor existente para este atributo y producto
-            valor_atributo_existente = ValorAtributoProducto.query.filter_by(
-                producto_id=producto.id,
-                atributo_id=atributo.id
-            ).first()
-
-            if valor_atributo_existente:
-                valor_atributo_existente.valor = str(valor_data)
-            else:
-                #En el caso improbable de que no exista, lo creamos
-                nuevo_valor = ValorAtributoProducto(
-                    valor=str(valor_data),
-                    producto_id=producto.id,
-                    atributo_id=atributo.id
-                )
-                db.session.add(nuevo_valor)
-
+        #Actualizar los valores de los atributos dinámicos (en modo 'json', solo la fila del producto)
+        producto.guardar_valores_atributos(
+            {atributo_id: form[f'attr_{atributo_id}'].data for atributo_id in DynamicProductForm.atributo_ids}
+        )
         db.session.commit()
         flash('Producto actualizado exitosamente.', 'success')
         return redirect(url_for('admin.listar_productos'))
 
     #Logica para precargar el formulario con los datos existentes
-    for atributo in tipo.atributos:
-        field_name = f'attr_{atributo.id}'
-        valor_existente = ValorAtributoProducto.query.filter_by(
-            producto_id=producto.id,
-            atributo_id=atributo.id
-        ).first()
-        if valor_existente:
+    valores_existentes = producto.valores_por_atributo()
+    for atributo_id in DynamicProductForm.atributo_ids:
+        field_name = f'attr_{atributo_id}'
+        if atributo_id in valores_existentes:
             #Obtiene el campo del formulario y asigna su valor
             form_field = getattr(form, field_name)
-            form_field.data = valor_existente.valor
+            form_field.data = valores_existentes[atributo_id]
 
     return render_template('admin/crear_editar_producto_dinamico.html',
                            form=form,
@@ -440,8 +628,13 @@ def eliminar_producto(id):
 # -----------------------------------------------------------------------------
 @bp.route('/clientes')
 def listar_clientes():
-    clientes = Cliente.query.all()
-    return render_template('admin/clientes.html', clientes=clientes)
+    query = Cliente.query
+    nombre = request.args.get('nombre', '', type=str).strip()
+    if nombre:
+        #Prefijo sin distinguir mayúsculas: lower(nombre) LIKE 'texto%' lo resuelve el índice ix_cliente_nombre_prefijo
+        query = query.filter(func.lower(Cliente.nombre).like(f'{busqueda._escapar_like(nombre.lower())}%', escape='\\'))
+    pagina = _paginar(query, (Cliente.nombre, Cliente.id), descendente=False)
+    return render_template('admin/clientes.html', clientes=pagina.items, pagina=pagina, filtros=_filtros_listado())
 
 @bp.route('/clientes/crear', methods=['GET', 'POST'])
 def crear_cliente():
@@ -495,13 +688,8 @@ def buscar_clientes():
     if not search_term:
         return jsonify([])
 
-    #Buscamos por nombre, apellido o identificación
-    clientes = Cliente.query.filter(
-        or_(
-            (Cliente.nombre + ' ' + Cliente.apellido).ilike(f'%{search_term}%'),
-            Cliente.identificacion.ilike(f'%{search_term}%')
-        )
-    ).limit(10).all()
+    #Por prefijo de identificación/teléfono y por similitud de nombre y apellido, los más parecidos primero
+    clientes = busqueda.buscar_clientes(search_term, limite=10)
 
     #Devolvemos los resultados en formato JSON
     return jsonify([
@@ -510,14 +698,52 @@ def buscar_clientes():
     ])
 
 
+@bp.route('/api/productos/buscar')
+@login_required
+def buscar_productos():
+    """Productos cuyo nombre o algún valor de atributo contiene `q`, paginados.
+
+    Con `con_stock=1` solo devuelve productos con unidades disponibles.
+    """
+    search_term = request.args.get('q', '', type=str).strip()
+    pagina = max(request.args.get('pagina', 1, type=int), 1)
+    por_pagina = min(max(request.args.get('por_pagina', 20, type=int), 1), 50)
+    if not search_term:
+        return jsonify({'resultados': [], 'pagina': pagina, 'hay_mas': False})
+
+    patron = f'%{busqueda._escapar_like(search_term)}%'
+    #Ambas condiciones pueden resolverse con los índices trigram de producto (PostgreSQL)
+    query = Producto.query.filter(or_(Producto.nombre.ilike(patron, escape='\\'),
+                                      Producto.etiqueta_atributos.ilike(patron, escape='\\')))
+    if request.args.get('con_stock', type=int):
+        query = query.filter(Producto.stock > 0)
+
+    productos = query.order_by(Producto.nombre, Producto.id).offset((pagina - 1) * por_pagina).limit(por_pagina + 1).all()
+
+    return jsonify({
+        'resultados': [
+            {'id': p.id, 'text': p.etiqueta, 'precio': float(p.precio), 'stock': p.stock}
+            for p in productos[:por_pagina]
+        ],
+        'pagina': pagina,
+        'hay_mas': len(productos) > por_pagina
+    })
+
+
 # -----------------------------------------------------------------------------
 # --- RUTAS PARA GESTIÓN DE GASTOS ---
 # -----------------------------------------------------------------------------
 @bp.route('/gastos')
 @login_required
 def listar_gastos():
-    gastos = Gasto.query.order_by(Gasto.fecha.desc()).all()
-    return render_template('admin/gastos.html', gastos=gastos, titulo='Registro de Gastos')
+    query = _filtrar_por_fechas(Gasto.query.options(joinedload(Gasto.categoria)), Gasto.fecha)
+    categoria_id = request.args.get('categoria_id', type=int)
+    if categoria_id:
+        query = query.filter(Gasto.categoria_id == categoria_id)
+    pagina = _paginar(query, (Gasto.fecha, Gasto.id))
+    categorias = CategoriaGasto.query.order_by(CategoriaGasto.nombre).all()
+    return render_template('admin/gastos.html', gastos=pagina.items, pagina=pagina, filtros=_filtros_listado(),
+                           categorias=categorias, titulo='Registro de Gastos')
 
 @bp.route('/gastos/crear', methods=['GET', 'POST'])
 @admin_required
@@ -614,8 +840,17 @@ def eliminar_categoria_gasto(id):
 # -----------------------------------------------------------------------------
 @bp.route('/ventas')
 def listar_ventas():
-    ventas = Venta.query.order_by(Venta.fecha_venta.desc()).all()
-    return render_template('admin/ventas.html', ventas=ventas)
+    query = _filtrar_por_fechas(Venta.query.options(joinedload(Venta.cliente)), Venta.fecha_venta)
+    estado = request.args.get('estado', '', type=str)
+    if estado:
+        query = query.filter(Venta.estado == estado)
+    cliente_id = request.args.get('cliente_id', type=int)
+    if cliente_id:
+        query = query.filter(Venta.cliente_id == cliente_id)
+    pagina = _paginar(query, (Venta.fecha_venta, Venta.id))
+    cliente = Cliente.query.get(cliente_id) if cliente_id else None
+    return render_template('admin/ventas.html', ventas=pagina.items, pagina=pagina, filtros=_filtros_listado(),
+                           estados=ESTADOS_VENTA, cliente=cliente, export_form=EmptyForm())
 
 @bp.route('/ventas/crear', methods=['GET', 'POST'])
 def crear_venta():
@@ -641,7 +876,7 @@ def crear_venta():
 
 @bp.route('/ventas/editar/<int:id>', methods=['GET', 'POST'])
 def editar_venta(id):
-    venta = Venta.query.get_or_404(id)
+    venta = _venta_con_productos(id)
     config = Configuracion.obtener_config()
 
     if venta.estado != 'En Proceso':
@@ -652,16 +887,6 @@ def editar_venta(id):
     agregar_producto_form = AgregarProductoVentaForm()
     credito_form = CreditoForm(obj=venta)
 
-    productos_disponibles = Producto.query.filter(Producto.stock > 0).order_by(Producto.nombre).all()
-    opciones_productos = []
-    for p in productos_disponibles:
-        atributos_str = ", ".join(f"{val.atributo.nombre_atributo}: {val.valor}" for val in p.valores_atributos)
-        texto_opcion = f"{p.nombre} ({atributos_str})" if atributos_str else p.nombre
-        opciones_productos.append((p.id, texto_opcion))
-    agregar_producto_form.producto.choices = opciones_productos
-
-    stock_data = {str(p.id): p.stock for p in productos_disponibles}
-
     config_data_for_js = {
         'montoMinimoCredito': float(config.monto_minimo_credito or 0),
         'cuotasMaximas': {
@@ -672,10 +897,16 @@ def editar_venta(id):
     }
 
     if 'submit_producto' in request.form and agregar_producto_form.validate():
+        venta = _bloquear_venta(id)
         producto_id = agregar_producto_form.producto.data
         producto = Producto.query.get(producto_id)
         cantidad_a_vender = agregar_producto_form.cantidad.data
-        if cantidad_a_vender > producto.stock:
+        if venta.estado != 'En Proceso':
+            flash('Esta venta ya está finalizada y no se puede modificar.', 'warning')
+            return redirect(url_for('admin.ver_venta', id=id))
+        if not producto:
+            flash('El producto seleccionado no existe.', 'danger')
+        elif not producto.descontar_stock(cantidad_a_vender):
             flash(f'No se puede añadir. Solo quedan {producto.stock} unidades de "{producto.nombre}".', 'danger')
         else:
             asociacion_existente = VentaProducto.query.filter_by(venta_id=venta.id, producto_id=producto.id).first()
@@ -684,7 +915,7 @@ def editar_venta(id):
             else:
                 asociacion_existente = VentaProducto(venta_id=venta.id, producto_id=producto.id, cantidad=cantidad_a_vender, precio_unitario=producto.precio)
                 db.session.add(asociacion_existente)
-            producto.stock -= cantidad_a_vender
+            venta.monto_total = Venta.monto_total + asociacion_existente.precio_unitario * cantidad_a_vender
             db.session.commit()
             flash(f'{cantidad_a_vender} x "{producto.nombre}" añadido(s) a la venta.', 'success')
         return redirect(url_for('admin.editar_venta', id=id))
@@ -730,25 +961,25 @@ def editar_venta(id):
         db.session.commit()
         return redirect(url_for('admin.ver_venta', id=id))
 
-    total_calculado = db.session.query(func.sum(VentaProducto.precio_unitario * VentaProducto.cantidad)).filter_by(venta_id=id).scalar() or 0
-    venta.monto_total = total_calculado
-    db.session.commit()
-
     return render_template('admin/editar_venta.html',
                            venta=venta,
                            agregar_producto_form=agregar_producto_form,
                            credito_form=credito_form,
                            anular_venta_form=anular_venta_form,
-                           stock_data=stock_data,
                            config=config,
                            config_data=config_data_for_js)
 
 @bp.route('/ventas/editar/<int:venta_id>/eliminar_producto/<int:producto_asociado_id>', methods=['POST'])
 @admin_required
 def eliminar_producto_venta(venta_id, producto_asociado_id):
-    asociacion = VentaProducto.query.get_or_404(producto_asociado_id)
+    venta = _bloquear_venta(venta_id)
+    #Solo se quitan líneas de esta venta y mientras sigue en proceso; el total de una venta finalizada no cambia
+    asociacion = VentaProducto.query.filter_by(id=producto_asociado_id, venta_id=venta.id).first_or_404()
+    if venta.estado != 'En Proceso':
+        abort(400)
     producto = Producto.query.get(asociacion.producto_id)
-    producto.stock += asociacion.cantidad
+    producto.reponer_stock(asociacion.cantidad)
+    venta.monto_total = Venta.monto_total - asociacion.precio_unitario * asociacion.cantidad
     db.session.delete(asociacion)
     db.session.commit()
     flash('Producto eliminado de la venta.', 'success')
@@ -760,21 +991,43 @@ def finalizar_venta(id):
     return redirect(url_for('admin.editar_venta', id=id))
 
 
+def _venta_con_productos(id):
+    """Venta con sus líneas y productos cargados en un número fijo de consultas."""
+    return Venta.query.options(
+        selectinload(Venta.productos_asociados).joinedload(VentaProducto.producto)
+    ).get_or_404(id)
+
+
+def _bloquear_venta(id):
+    """Venta bloqueada hasta el commit (SELECT ... FOR UPDATE) y con sus datos recién leídos.
+
+    Quien modifica las líneas de una venta la bloquea antes de tocar el stock: dos altas simultáneas del
+    mismo producto se hacen una tras otra (sin líneas duplicadas) y siempre en el mismo orden de bloqueo.
+    """
+    return Venta.query.filter_by(id=id).with_for_update().populate_existing().first_or_404()
+
+
+def _cantidades_devueltas(venta_id):
+    """Unidades ya devueltas de cada producto de la venta: {producto_id: cantidad}."""
+    filas = db.session.query(
+        DevolucionProducto.producto_id, func.sum(DevolucionProducto.cantidad_devuelta)
+    ).join(Devolucion).filter(Devolucion.venta_id == venta_id).group_by(DevolucionProducto.producto_id).all()
+    return {producto_id: cantidad or 0 for producto_id, cantidad in filas}
+
+
 @bp.route('/ventas/<int:id>')
 def ver_venta(id):
-    venta = Venta.query.get_or_404(id)
+    venta = _venta_con_productos(id)
     config = Configuracion.obtener_config()
     pago_form = PagoForm()
     pago_cuota_form = PagoCuotaForm()
-    total_pagado = db.session.query(func.sum(Pago.monto_pago)).filter_by(venta_id=id).scalar() or 0
+    total_pagado = venta.total_pagado
     pagos_ordenados = venta.pagos.order_by(Pago.fecha_pago.asc()).all()
 
     productos_activos_en_venta = []
+    cantidades_devueltas = _cantidades_devueltas(venta.id)
     for item_venta in venta.productos_asociados:
-        cantidad_devuelta = db.session.query(func.sum(DevolucionProducto.cantidad_devuelta)).join(Devolucion).filter(
-            Devolucion.venta_id == venta.id,
-            DevolucionProducto.producto_id == item_venta.producto_id
-        ).scalar() or 0
+        cantidad_devuelta = cantidades_devueltas.get(item_venta.producto_id, 0)
 
         cantidad_activa = item_venta.cantidad - cantidad_devuelta
         if cantidad_activa > 0:
@@ -844,9 +1097,9 @@ def agregar_pago(id):
         monto_pago_actual = Decimal(pago_form.monto_pago.data)
         monto_total_venta = Decimal(venta.monto_total)
 
-        total_pagado_anterior = Decimal(db.session.query(func.sum(Pago.monto_pago)).filter_by(venta_id=id).scalar() or 0)
+        total_pagado_anterior = Decimal(venta.total_pagado)
 
-        saldo_pendiente = monto_total_venta - total_pagado_anterior
+        saldo_pendiente = Decimal(venta.saldo_pendiente)
 
         if monto_pago_actual > saldo_pendiente and not isclose(monto_pago_actual, saldo_pendiente):
             flash('El monto del pago no puede exceder el saldo pendiente.', 'danger')
@@ -889,7 +1142,7 @@ def anular_venta(id):
         for item in venta.productos_asociados:
             producto = Producto.query.get(item.producto_id)
             if producto:
-                producto.stock += item.cantidad
+                producto.reponer_stock(item.cantidad)
 
         #Marcar la venta como anulada
         venta.estado = 'Anulada'
@@ -956,80 +1209,138 @@ def pagar_cuota(cuota_id):
 
     return redirect(url_for('admin.ver_venta', id=venta.id))
 
-def _generar_imagen_weasyprint(html_string, output_path):
-    try:
-        #La URL base es necesaria para que WeasyPrint pueda encontrar archivos
-        base_url = request.url_root
-        html_doc = HTML(string=html_string, base_url=base_url)
+def _entregar_documento(template_name, contexto, carpeta, prefijo, venta_id, mensaje_ok, mensaje_error):
+    """Genera el PNG del documento en static/<carpeta>/ y vuelve a la venta para mostrarlo.
 
-        #CREAR REGLA CSS
-        css_style = CSS(string='@page { size: A4; margin: 0; }')
+    El nombre del archivo lleva la huella de lo que lo determina (HTML, plantilla, logo, versión de la
+    configuración): si ya existe se sirve tal cual, sin volver a renderizar. Con procesos de renderizado
+    (DOCUMENTOS_PROCESOS) la petición responde al instante y la página de la venta consulta el estado
+    del trabajo hasta que la imagen está lista.
 
-        #GENERAR PDF EN MEMORIA
-        pdf_in_memory = html_doc.write_pdf(stylesheets=[css_style])
+    En formato PDF (DOCUMENTOS_FORMATO o ?formato=pdf) el documento se devuelve directamente desde
+    memoria, sin rasterizar ni escribir en disco; la huella sirve de ETag.
+    """
+    html_out = render_template(template_name, **contexto)
+    config = contexto['tienda_config']
+    archivos = [current_app.jinja_env.get_template(template_name).filename]
+    if config and config.logo_path:
+        archivos.append(os.path.join(current_app.static_folder, config.logo_path))
+    extras = [config.version if config else None]
+
+    formato = request.args.get('formato', current_app.config['DOCUMENTOS_FORMATO'])
+    if formato == 'pdf':
+        huella = documentos.huella_documento(html_out, archivos, extras)
+        #El navegador ya tiene este mismo PDF: no hace falta volver a renderizarlo
+        if huella in request.if_none_match:
+            respuesta = current_app.response_class(status=304)
+            respuesta.set_etag(huella)
+            return respuesta
+        try:
+            pdf = documentos.renderizar_pdf(html_out, documentos.base_url_estaticos())
+        except Exception as e:
+            flash(f'{mensaje_error}: {e}', 'danger')
+            current_app.logger.error(f"Error al generar {prefijo}.pdf: {e}", exc_info=True)
+            return redirect(url_for('admin.ver_venta', id=venta_id))
+        respuesta = send_file(io.BytesIO(pdf), mimetype='application/pdf', download_name=f'{prefijo}.pdf', etag=huella)
+        respuesta.headers['Cache-Control'] = 'private, no-cache'
+        return respuesta
+
+    #La resolución cambia la imagen, así que forma parte de la huella del PNG
+    extras.append(current_app.config['DOCUMENTOS_PNG_DPI'])
+    huella = documentos.huella_documento(html_out, archivos, extras)[:16]
+
+    output_dir = os.path.join(current_app.static_folder, carpeta)
+    os.makedirs(output_dir, exist_ok=True)
+    filename = f'{prefijo}_{huella}.png'
+    filepath = os.path.join(output_dir, filename)
 
-        #CONVERTIR PDF A IMAGEN
-        images = convert_from_bytes(pdf_in_memory)
+    #La URL solo cambia cuando cambia el documento, así el navegador puede reutilizar su copia (ETag)
+    image_path = url_for('static', filename=f'{carpeta}/{filename}')
+    destination_url = f"{url_for('admin.ver_venta', id=venta_id)}?generated_image_url={image_path}&v={huella}"
 
-        #GUARDAR LA IMAGEN
-        if images:
-            images[0].save(output_path, 'PNG')
+    if os.path.exists(filepath):
+        flash(mensaje_ok, 'success')
+        return redirect(destination_url)
 
+    anteriores = glob.glob(os.path.join(output_dir, f'{glob.escape(prefijo)}_*.png'))
+    try:
+        #Las rutas relativas se resuelven contra la carpeta static, sin pedirle los archivos a este mismo servidor
+        trabajo_id = documentos.encolar(html_out, documentos.base_url_estaticos(), filepath, {'destino': destination_url}, anteriores)
     except Exception as e:
-        current_app.logger.error(f"Error al generar imagen con WeasyPrint/pdf2image: {e}", exc_info=True)
-        raise
+        flash(f'{mensaje_error}: {e}', 'danger')
+        current_app.logger.error(f"Error al generar {filename}: {e}", exc_info=True)
+        return redirect(url_for('admin.ver_venta', id=venta_id))
+
+    if not current_app.config['DOCUMENTOS_PROCESOS']:
+        flash(mensaje_ok, 'success')
+        return redirect(destination_url)
+    return redirect(url_for('admin.ver_venta', id=venta_id, trabajo=trabajo_id))
+
+@bp.route('/documentos/trabajos/<trabajo_id>')
+@login_required
+def estado_trabajo_documento(trabajo_id):
+    """Estado de un documento en preparación: pendiente, listo (con la URL de destino) o error."""
+    estado = documentos.estado_trabajo(trabajo_id)
+    if estado is None:
+        return jsonify({'estado': 'desconocido'}), 404
+    return jsonify(estado)
+
+@bp.route('/ventas/exportar', methods=['POST'])
+@admin_required
+def exportar_documentos():
+    """Exporta las facturas o estados de cuenta de las ventas filtradas (fechas, cliente) en un ZIP o un PDF."""
+    filtros = {k: v for k, v in request.form.items() if v and k in ('desde', 'hasta', 'cliente_id')}
+    form = EmptyForm()
+    tipo = request.form.get('tipo')
+    formato = request.form.get('formato')
+    if not form.validate_on_submit() or tipo not in exportacion.TIPOS or formato not in exportacion.FORMATOS:
+        flash('Solicitud de exportación no válida.', 'danger')
+        return redirect(url_for('admin.listar_ventas', **filtros))
+    try:
+        desde = date.fromisoformat(filtros['desde']) if 'desde' in filtros else None
+        hasta = date.fromisoformat(filtros['hasta']) if 'hasta' in filtros else None
+        cliente_id = int(filtros['cliente_id']) if 'cliente_id' in filtros else None
+    except ValueError:
+        flash('Los filtros de la exportación no son válidos.', 'danger')
+        return redirect(url_for('admin.listar_ventas'))
+
+    if not exportacion.consultar_ventas(tipo, desde, hasta, cliente_id).first():
+        flash('No hay ventas con documentos que exportar para esos filtros.', 'warning')
+        return redirect(url_for('admin.listar_ventas', **filtros))
+    trabajo_id = exportacion.iniciar(tipo, formato, desde, hasta, cliente_id)
+    return redirect(url_for('admin.listar_ventas', exportacion=trabajo_id, **filtros))
+
+@bp.route('/documentos/exportaciones/<trabajo_id>')
+@admin_required
+def descargar_exportacion(trabajo_id):
+    estado = documentos.estado_trabajo(trabajo_id)
+    if not estado or estado.get('estado') != 'listo':
+        flash('La exportación no existe o todavía no ha terminado.', 'warning')
+        return redirect(url_for('admin.listar_ventas'))
+    #send_file lo envía por partes desde el disco
+    mimetype = 'application/zip' if estado['formato'] == 'zip' else 'application/pdf'
+    return send_file(documentos.ruta_trabajo(trabajo_id, estado['formato']), mimetype=mimetype,
+                     as_attachment=True, download_name=estado['nombre'])
 
 @bp.route('/ventas/<int:id>/generar_recibo')
 @login_required
 def generar_recibo_venta(id):
     venta = Venta.query.get_or_404(id)
-    pagos = venta.pagos.order_by(Pago.fecha_pago.asc()).all()
-    total_pagado = db.session.query(func.sum(Pago.monto_pago)).filter_by(venta_id=id).scalar() or 0
     config = Configuracion.obtener_config()
 
-    logo_url = None
-    if config and config.logo_path:
-        path_absoluto = os.path.join(current_app.static_folder, config.logo_path)
-        logo_url = f"file://{path_absoluto}"
-
     #Lógica condicional para elegir la plantilla correcta
     if venta.tipo_pago == 'Credito':
         template_name = 'admin/receipts/estado_cuenta_template.html'
-        document_name = f'estado_cuenta_venta_{venta.id}.png'
+        document_name = f'estado_cuenta_venta_{venta.id}'
         flash_message = '¡Estado de cuenta generado exitosamente!'
     else:
         template_name = 'admin/receipts/receipt_template.html'
-        document_name = f'recibo_venta_{venta.id}.png'
+        document_name = f'recibo_venta_{venta.id}'
         flash_message = '¡Recibo en imagen generado exitosamente!'
 
-    html_out = render_template(
-        template_name,
-        venta=venta,
-        total_pagado=total_pagado,
-        pagos=pagos,
-        tienda_config=config,
-        logo_url=logo_url,
-        now=datetime.utcnow()
-    )
-
-    output_dir = os.path.join(current_app.static_folder, 'receipts')
-    os.makedirs(output_dir, exist_ok=True)
-    filepath = os.path.join(output_dir, document_name)
-
-    try:
-        _generar_imagen_weasyprint(html_out, filepath)
-    except Exception as e:
-        flash(f'Error al generar la imagen del documento: {e}', 'danger')
-        current_app.logger.error(f"Error en generar_recibo_venta: {e}", exc_info=True)
-        return redirect(url_for('admin.ver_venta', id=id))
-
-    flash(flash_message, 'success')
-
-    image_path = url_for('static', filename=os.path.join('receipts', document_name))
-    timestamp = datetime.utcnow().timestamp()
-    destination_url = f"{url_for('admin.ver_venta', id=id)}?generated_image_url={image_path}&v={timestamp}"
-
-    return redirect(destination_url)
+    contexto = exportacion.contexto_documento(venta, config)
+    return _entregar_documento(template_name, contexto, 'receipts', document_name, venta.id,
+                               flash_message, 'Error al generar la imagen del documento')
 
 @bp.route('/ventas/<int:id>/generar_factura')
 @login_required
@@ -1039,45 +1350,9 @@ def generar_factura_venta(id):
         flash('Solo se pueden generar facturas finales para ventas pagadas.', 'warning')
         return redirect(url_for('admin.ver_venta', id=id))
 
-    pagos = venta.pagos.order_by(Pago.fecha_pago.asc()).all()
-    config = Configuracion.obtener_config()
-    total_pagado = db.session.query(func.sum(Pago.monto_pago)).filter_by(venta_id=id).scalar() or 0
-
-    logo_url = None
-    if config and config.logo_path:
-        path_absoluto = os.path.join(current_app.static_folder, config.logo_path)
-        logo_url = f"file://{path_absoluto}"
-
-    html_out = render_template(
-        'admin/receipts/invoice_template.html',
-        venta=venta,
-        pagos=pagos,
-        total_pagado=total_pagado,
-        tienda_config=config,
-        logo_url=logo_url,
-        now=datetime.utcnow()
-    )
-
-    receipts_dir = os.path.join(current_app.static_folder, 'receipts')
-    os.makedirs(receipts_dir, exist_ok=True)
-    filename = f'factura_venta_{venta.id}.png'
-    filepath = os.path.join(receipts_dir, filename)
-
-    try:
-        _generar_imagen_weasyprint(html_out, filepath)
-    except Exception as e:
-        flash(f'Error al generar la imagen de la factura: {e}', 'danger')
-        current_app.logger.error(f"Error en generar_factura_venta: {e}", exc_info=True)
-        return redirect(url_for('admin.ver_venta', id=id))
-
-    flash('¡Factura final generada exitosamente!', 'success')
-
-    image_path = url_for('static', filename=os.path.join('receipts', filename))
-    timestamp = datetime.utcnow().timestamp()
-
-    destination_url = f"{url_for('admin.ver_venta', id=id)}?generated_image_url={image_path}&v={timestamp}"
-
-    return redirect(destination_url)
+    contexto = exportacion.contexto_documento(venta, Configuracion.obtener_config())
+    return _entregar_documento('admin/receipts/invoice_template.html', contexto, 'receipts', f'factura_venta_{venta.id}', venta.id,
+                               '¡Factura final generada exitosamente!', 'Error al generar la imagen de la factura')
 
 @bp.route('/ventas/<int:id>/generar_plan_pago')
 @login_required
@@ -1101,13 +1376,9 @@ def generar_plan_pago(id):
     elif venta.frecuencia_cuotas == 'Mensual':
         tasa_interes = config.interes_mensual
 
-    logo_url = None
-    if config and config.logo_path:
-        path_absoluto = os.path.join(current_app.static_folder, config.logo_path)
-        logo_url = f"file://{path_absoluto}"
+    logo_url = documentos.url_logo(config)
 
-    html_out = render_template(
-        'admin/credit/plan_pago_template.html',
+    contexto = dict(
         venta=venta,
         tienda_config=config,
         logo_url=logo_url,
@@ -1119,26 +1390,8 @@ def generar_plan_pago(id):
     )
 
     #Generación de la imagen
-    output_dir = os.path.join(current_app.static_folder, 'credit_plans')
-    os.makedirs(output_dir, exist_ok=True)
-    filename = f'plan_pago_venta_{venta.id}.png'
-    filepath = os.path.join(output_dir, filename)
-
-    try:
-        _generar_imagen_weasyprint(html_out, filepath)
-    except Exception as e:
-        flash(f'Error al generar la imagen del plan de pagos: {e}', 'danger')
-        current_app.logger.error(f"Error en generar_plan_pago: {e}", exc_info=True)
-        return redirect(url_for('admin.ver_venta', id=id))
-
-    flash('¡Imagen del plan de pagos generada exitosamente!', 'success')
-
-    #Redirigir de vuelta a la vista de la venta con la URL de la imagen para mostrarla
-    image_path = url_for('static', filename=os.path.join('credit_plans', filename))
-    timestamp = datetime.utcnow().timestamp()
-    destination_url = f"{url_for('admin.ver_venta', id=id)}?generated_image_url={image_path}&v={timestamp}"
-
-    return redirect(destination_url)
+    return _entregar_documento('admin/credit/plan_pago_template.html', contexto, 'credit_plans', f'plan_pago_venta_{venta.id}', venta.id,
+                               '¡Imagen del plan de pagos generada exitosamente!', 'Error al generar la imagen del plan de pagos')
 
 
 # -----------------------------------------------------------------------------
@@ -1263,6 +1516,7 @@ def crear_atributo(id):
     if form.validate_on_submit():
         nuevo_atributo = Atributo(nombre_atributo=form.nombre_atributo.data, tipo_campo=form.tipo_campo.data, tipo_producto_id=tipo.id)
         db.session.add(nuevo_atributo)
+        tipo.marcar_cambio_esquema()
         db.session.commit()
         flash(f'Atributo "{nuevo_atributo.nombre_atributo}" añadido.', 'success')
     return redirect(url_for('admin.detalle_tipo_producto', id=id))
@@ -1275,6 +1529,7 @@ def crear_opcion_atributo(id):
     if form.validate_on_submit():
         nueva_opcion = OpcionAtributo(valor_opcion=form.valor_opcion.data, atributo_id=atributo.id)
         db.session.add(nueva_opcion)
+        atributo.tipo_producto.marcar_cambio_esquema()
         db.session.commit()
         flash(f'Opción "{nueva_opcion.valor_opcion}" añadida a {atributo.nombre_atributo}.', 'success')
     return redirect(url_for('admin.detalle_tipo_producto', id=atributo.tipo_producto_id))
@@ -1285,6 +1540,7 @@ def eliminar_atributo(id):
     atributo = Atributo.query.get_or_404(id)
     tipo_producto_id = atributo.tipo_producto_id
     db.session.delete(atributo)
+    atributo.tipo_producto.marcar_cambio_esquema()
     db.session.commit()
     flash('Atributo eliminado.', 'success')
     return redirect(url_for('admin.detalle_tipo_producto', id=tipo_producto_id))
@@ -1295,6 +1551,7 @@ def eliminar_opcion_atributo(id):
     opcion = OpcionAtributo.query.get_or_404(id)
     tipo_producto_id = opcion.atributo.tipo_producto_id
     db.session.delete(opcion)
+    opcion.atributo.tipo_producto.marcar_cambio_esquema()
     db.session.commit()
     flash('Opción eliminada.', 'success')
     return redirect(url_for('admin.detalle_tipo_producto', id=tipo_producto_id))
@@ -1334,6 +1591,73 @@ def api_calcular_cuotas():
         'total_interes': float(total_interes)
     })
 
+@bp.route('/api/ventas/<int:id>/carrito', methods=['POST'])
+@login_required
+def api_carrito_venta(id):
+    """Añade varios productos a una venta en proceso en una sola transacción.
+
+    Espera {"productos": [{"producto_id": 1, "cantidad": 2}, ...]}.
+    """
+    #Bloqueada hasta el commit: dos envíos simultáneos del carrito no pueden crear la misma línea dos veces
+    venta = _bloquear_venta(id)
+    if venta.estado != 'En Proceso':
+        return jsonify({'error': 'Esta venta ya está finalizada y no se puede modificar.'}), 409
+
+    data = request.get_json(silent=True) or {}
+    cantidades = {}
+    try:
+        for linea in data.get('productos') or []:
+            producto_id = int(linea['producto_id'])
+            cantidad = int(linea['cantidad'])
+            if cantidad <= 0:
+                raise ValueError
+            cantidades[producto_id] = cantidades.get(producto_id, 0) + cantidad
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Cada producto necesita producto_id y una cantidad entera positiva.'}), 400
+    if not cantidades:
+        return jsonify({'error': 'No se recibieron productos.'}), 400
+
+    productos = {p.id: p for p in Producto.query.filter(Producto.id.in_(cantidades)).all()}
+    inexistentes = [producto_id for producto_id in cantidades if producto_id not in productos]
+    if inexistentes:
+        return jsonify({'error': 'Algunos productos no existen.', 'productos': inexistentes}), 404
+
+    #Todo el stock se valida y descuenta en una sola sentencia; si algo falta no se añade nada
+    if not Producto.descontar_stock_lote(cantidades):
+        db.session.rollback()
+        stock_actual = dict(db.session.query(Producto.id, Producto.stock).filter(Producto.id.in_(cantidades)).all())
+        sin_stock = [
+            {'producto_id': producto_id, 'nombre': productos[producto_id].nombre,
+             'solicitado': cantidad, 'disponible': stock_actual.get(producto_id, 0)}
+            for producto_id, cantidad in cantidades.items() if stock_actual.get(producto_id, 0) < cantidad
+        ]
+        return jsonify({'error': 'No hay stock suficiente.', 'productos': sin_stock}), 409
+
+    lineas = {
+        vp.producto_id: vp for vp in VentaProducto.query.filter(
+            VentaProducto.venta_id == venta.id, VentaProducto.producto_id.in_(cantidades)
+        )
+    }
+    incremento = Decimal('0')
+    for producto_id, cantidad in cantidades.items():
+        linea = lineas.get(producto_id)
+        if linea:
+            linea.cantidad += cantidad
+        else:
+            linea = VentaProducto(venta_id=venta.id, producto_id=producto_id, cantidad=cantidad,
+                                  precio_unitario=productos[producto_id].precio)
+            db.session.add(linea)
+        incremento += linea.precio_unitario * cantidad
+    venta.monto_total = Venta.monto_total + incremento
+    db.session.commit()
+
+    return jsonify({
+        'venta_id': venta.id,
+        'monto_total': float(venta.monto_total),
+        'numero_productos': len(venta.productos_asociados),
+        'agregados': [{'producto_id': producto_id, 'cantidad': cantidad} for producto_id, cantidad in cantidades.items()]
+    })
+
 
 # -----------------------------------------------------------------------------
 # --- RUTAS PARA DEVOLUCIONES ---
@@ -1341,7 +1665,7 @@ def api_calcular_cuotas():
 @bp.route('/ventas/<int:venta_id>/devolucion', methods=['GET', 'POST'])
 @admin_required
 def procesar_devolucion(venta_id):
-    venta = Venta.query.get_or_404(venta_id)
+    venta = _venta_con_productos(venta_id)
     config = Configuracion.obtener_config()
 
     dias_desde_venta = (datetime.utcnow() - venta.fecha_venta).days
@@ -1355,33 +1679,16 @@ def procesar_devolucion(venta_id):
 
     form = DevolucionForm()
     agregar_producto_form = AgregarProductoVentaForm()
-    productos_disponibles = Producto.query.filter(Producto.stock > 0).order_by(Producto.nombre).all()
-    opciones_productos = []
-    for p in productos_disponibles:
-        atributos_str = ", ".join(f"{val.atributo.nombre_atributo}: {val.valor}" for val in p.valores_atributos)
-        texto_opcion = f"{p.nombre} ({atributos_str})" if atributos_str else p.nombre
-        opciones_productos.append((p.id, texto_opcion))
-    agregar_producto_form.producto.choices = opciones_productos
-
-    #Crear un diccionario de datos para JavaScript
-    product_data_for_js = {
-        str(p.id): {
-            'texto': opciones_productos[i][1],
-            'precio': float(p.precio)
-        } for i, p in enumerate(productos_disponibles)
-    }
 
     if form.validate_on_submit():
         monto_total_devolucion = Decimal('0.0')
         productos_devueltos_data = []
+        cantidades_devueltas = _cantidades_devueltas(venta.id)
         for i, producto_form in enumerate(form.productos):
             cantidad_a_devolver = producto_form.cantidad_a_devolver.data or 0
             if cantidad_a_devolver > 0:
                 item_original = venta.productos_asociados[i]
-                devoluciones_previas = db.session.query(func.sum(DevolucionProducto.cantidad_devuelta)).join(Devolucion).filter(
-                    Devolucion.venta_id == venta.id,
-                    DevolucionProducto.producto_id == item_original.producto_id
-                ).scalar() or 0
+                devoluciones_previas = cantidades_devueltas.get(item_original.producto_id, 0)
                 if cantidad_a_devolver > (item_original.cantidad - devoluciones_previas):
                     flash(f"Error: La cantidad a devolver para '{item_original.producto.nombre}' excede la cantidad restante.", 'danger')
                     return redirect(url_for('admin.procesar_devolucion', venta_id=venta.id))
@@ -1390,12 +1697,16 @@ def procesar_devolucion(venta_id):
 
         monto_nuevo_cargo = Decimal('0.0')
         nuevos_productos_data = []
-        nuevos_productos_ids = request.form.getlist('nuevo_producto_id')
+        nuevos_productos_ids = request.form.getlist('nuevo_producto_id', type=int)
         nuevas_cantidades = request.form.getlist('nueva_cantidad')
+        productos_cambio = {p.id: p for p in Producto.query.filter(Producto.id.in_(nuevos_productos_ids))}
         for prod_id, cantidad_str in zip(nuevos_productos_ids, nuevas_cantidades):
             cantidad = int(cantidad_str)
             if cantidad > 0:
-                producto = Producto.query.get(prod_id)
+                producto = productos_cambio.get(prod_id)
+                if not producto:
+                    flash('Uno de los productos del cambio ya no existe.', 'danger')
+                    return redirect(url_for('admin.procesar_devolucion', venta_id=venta.id))
                 monto_nuevo_cargo += producto.precio * cantidad
                 nuevos_productos_data.append({'producto': producto, 'cantidad': cantidad})
 
@@ -1413,14 +1724,17 @@ def procesar_devolucion(venta_id):
                 dev_prod = DevolucionProducto(devolucion_id=nueva_devolucion.id, producto_id=data['item_original'].producto_id, cantidad_devuelta=data['form_data'].cantidad_a_devolver.data, devuelto_al_stock=data['form_data'].devuelto_al_stock.data)
                 if dev_prod.devuelto_al_stock:
                     producto = Producto.query.get(dev_prod.producto_id)
-                    producto.stock += dev_prod.cantidad_devuelta
+                    producto.reponer_stock(dev_prod.cantidad_devuelta)
                 db.session.add(dev_prod)
 
         if nuevos_productos_data:
             for data in nuevos_productos_data:
+                if not data['producto'].descontar_stock(data['cantidad']):
+                    db.session.rollback()
+                    flash(f"No hay stock suficiente de '{data['producto'].nombre}'. Solo quedan {data['producto'].stock} unidades.", 'danger')
+                    return redirect(url_for('admin.procesar_devolucion', venta_id=venta.id))
                 asociacion = VentaProducto(venta_id=venta.id, producto_id=data['producto'].id, cantidad=data['cantidad'], precio_unitario=data['producto'].precio)
                 db.session.add(asociacion)
-                data['producto'].stock -= data['cantidad']
 
         if balance > 0:
             nuevo_pago = Pago(monto_pago=balance, metodo_pago=form.metodo_reembolso.data, venta_id=venta.id, fecha_pago=datetime.utcnow())
@@ -1450,8 +1764,9 @@ def procesar_devolucion(venta_id):
     if request.method == 'GET':
         while len(form.productos) > 0:
             form.productos.pop_entry()
+        cantidades_devueltas = _cantidades_devueltas(venta.id)
         for item in venta.productos_asociados:
-            devoluciones_previas = db.session.query(func.sum(DevolucionProducto.cantidad_devuelta)).join(Devolucion).filter(Devolucion.venta_id == venta.id, DevolucionProducto.producto_id == item.producto_id).scalar() or 0
+            devoluciones_previas = cantidades_devueltas.get(item.producto_id, 0)
             producto_form = DevolucionProductoForm()
             producto_form.producto_id = item.producto_id
             producto_form.cantidad_a_devolver = item.cantidad - devoluciones_previas
@@ -1461,14 +1776,22 @@ def procesar_devolucion(venta_id):
                            titulo='Procesar Devolución o Cambio',
                            venta=venta,
                            form=form,
-                           agregar_producto_form=agregar_producto_form,
-                           product_data=product_data_for_js)
+                           agregar_producto_form=agregar_producto_form)
 
 @bp.route('/devoluciones')
 @login_required
 def listar_devoluciones():
-    devoluciones = Devolucion.query.order_by(Devolucion.fecha_devolucion.desc()).all()
-    return render_template('admin/devoluciones.html', devoluciones=devoluciones, titulo='Historial de Devoluciones')
+    query = _filtrar_por_fechas(
+        Devolucion.query.options(joinedload(Devolucion.venta).joinedload(Venta.cliente)),
+        Devolucion.fecha_devolucion
+    )
+    cliente_id = request.args.get('cliente_id', type=int)
+    if cliente_id:
+        query = query.join(Venta, Devolucion.venta_id == Venta.id).filter(Venta.cliente_id == cliente_id)
+    pagina = _paginar(query, (Devolucion.fecha_devolucion, Devolucion.id))
+    cliente = Cliente.query.get(cliente_id) if cliente_id else None
+    return render_template('admin/devoluciones.html', devoluciones=pagina.items, pagina=pagina, filtros=_filtros_listado(),
+                           cliente=cliente, titulo='Historial de Devoluciones')
 
 @bp.route('/devoluciones/<int:id>')
 @login_required
@@ -1,8 +1,12 @@
 import click
 import os # <-- Importar el módulo 'os'
+from datetime import datetime, timedelta
 from flask.cli import with_appcontext
+from sqlalchemy import func
 from app import db
 from app.models.usuario import Usuario
+from app.models.venta import Venta
+from app.models.gasto import Gasto
 
 # --- NUEVO COMANDO AUTOMÁTICO ---
 @click.command(name='crear-admin-auto')
@@ -51,6 +55,295 @@ def crear_admin_manual():
 
     click.echo(f'Administrador {nombre} creado exitosamente.')
 
+# --- MANTENIMIENTO DE LOS RESÚMENES DEL DASHBOARD ---
+@click.command(name='reconstruir-resumenes')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Primer día a reconstruir (YYYY-MM-DD). Por defecto, el primer registro.')
+@click.option('--hasta', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Último día a reconstruir (YYYY-MM-DD). Por defecto, hoy.')
+@with_appcontext
+def reconstruir_resumenes(desde, hasta):
+    """Rellena o reconstruye las tablas de resumen diario del dashboard."""
+    from app.utils.resumenes import reconstruir_resumenes as reconstruir
+
+    if desde:
+        desde = desde.date()
+    else:
+        primeras_fechas = [f for f in (db.session.query(func.min(Venta.fecha_venta)).scalar(),
+                                       db.session.query(func.min(Gasto.fecha)).scalar()) if f]
+        if not primeras_fechas:
+            click.echo('No hay ventas ni gastos registrados. Nada que reconstruir.')
+            return
+        desde = min(primeras_fechas).date()
+    hasta = hasta.date() if hasta else datetime.utcnow().date()
+
+    #Se procesa por bloques de un mes para no cargar años de historial de una vez
+    inicio_bloque = desde
+    while inicio_bloque <= hasta:
+        fin_bloque = min(inicio_bloque + timedelta(days=30), hasta)
+        reconstruir(db.session, inicio_bloque, fin_bloque)
+        db.session.commit()
+        click.echo(f'Resúmenes reconstruidos del {inicio_bloque} al {fin_bloque}.')
+        inicio_bloque = fin_bloque + timedelta(days=1)
+
+    click.echo('Reconstrucción de resúmenes completada.')
+
+# --- VERIFICACIÓN DE LOS SALDOS DE LAS VENTAS ---
+@click.command(name='conciliar-saldos')
+@click.option('--reparar', is_flag=True, help='Corrige las ventas descuadradas con la suma real de sus pagos.')
+@with_appcontext
+def conciliar_saldos(reparar):
+    """Compara total_pagado/saldo_pendiente de cada venta con la suma de sus pagos."""
+    from app.utils.saldos import saldos_descuadrados
+
+    descuadres = saldos_descuadrados(db.session)
+    if not descuadres:
+        click.echo('Todos los saldos coinciden con los pagos registrados.')
+        return
+
+    for venta_id, total_pagado, saldo_pendiente, total_real, saldo_real in descuadres:
+        click.echo(f'Venta #{venta_id}: total pagado {total_pagado} (real {total_real}), '
+                   f'saldo pendiente {saldo_pendiente} (real {saldo_real}).')
+
+    if not reparar:
+        click.echo(f'{len(descuadres)} venta(s) descuadrada(s). Ejecute con --reparar para corregirlas.')
+        return
+
+    for venta_id, _, _, total_real, saldo_real in descuadres:
+        db.session.query(Venta).filter_by(id=venta_id).update(
+            {Venta.total_pagado: total_real, Venta.saldo_pendiente: saldo_real}, synchronize_session=False
+        )
+    db.session.commit()
+    click.echo(f'{len(descuadres)} venta(s) corregida(s).')
+
+# --- PRUEBA DE CONCURRENCIA SOBRE EL STOCK ---
+@click.command(name='benchmark-stock')
+@click.option('--base-datos', 'url', required=True,
+              help='URL de una base de datos desechable, nunca la de producción; se crean sus tablas si faltan.')
+@click.option('--hilos', default=16, show_default=True, help='Cajeros vendiendo a la vez.')
+@click.option('--stock', default=200, show_default=True, help='Unidades iniciales de cada producto de prueba.')
+@click.option('--intentos', default=50, show_default=True, help='Ventas que intenta cada hilo.')
+def benchmark_stock(url, hilos, stock, intentos):
+    """Vende desde varios hilos por las dos vías de descuento (un producto y el carrito completo) y
+    comprueba que el stock nunca queda negativo ni se pierde ninguna venta.
+    """
+    import threading
+    import time
+    from app import create_app
+    from config import Config
+    from app.models.producto import Producto
+    from app.models.tipo_producto import TipoProducto
+
+    #Aplicación aparte contra la base de datos de prueba: los productos del benchmark no aparecen en la tienda
+    app = create_app(type('ConfigBenchmark', (Config,), {'SQLALCHEMY_DATABASE_URI': url}))
+    with app.app_context():
+        db.create_all()
+        tipo = TipoProducto(nombre=f'Benchmark stock {os.getpid()}')
+        db.session.add(tipo)
+        db.session.flush()
+        suelto = Producto(nombre='Benchmark stock (suelto)', precio=1, stock=stock, tipo_producto_id=tipo.id)
+        carrito = Producto(nombre='Benchmark stock (carrito)', precio=1, stock=stock, tipo_producto_id=tipo.id)
+        db.session.add_all([suelto, carrito])
+        db.session.commit()
+        tipo_id, suelto_id, carrito_id = tipo.id, suelto.id, carrito.id
+
+        vendidas = {suelto_id: [], carrito_id: []}
+        rechazadas = []
+        errores = []
+
+        def cajero():
+            ok = {suelto_id: 0, carrito_id: 0}
+            rechazos = 0
+            with app.app_context():
+                try:
+                    for intento in range(intentos):
+                        if intento % 2:
+                            #Venta de un carrito con ambos productos (descontar_stock_lote, un solo UPDATE)
+                            if Producto.descontar_stock_lote({suelto_id: 1, carrito_id: 1}):
+                                db.session.commit()
+                                ok[suelto_id] += 1
+                                ok[carrito_id] += 1
+                            else:
+                                db.session.rollback()
+                                rechazos += 1
+                        else:
+                            item = db.session.get(Producto, suelto_id)
+                            if item.descontar_stock(1):
+                                ok[suelto_id] += 1
+                            else:
+                                rechazos += 1
+                            db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    errores.append(repr(e))
+                finally:
+                    db.session.remove()
+            for producto_id, unidades in ok.items():
+                vendidas[producto_id].append(unidades)
+            rechazadas.append(rechazos)
+
+        try:
+            inicio = time.perf_counter()
+            trabajadores = [threading.Thread(target=cajero) for _ in range(hilos)]
+            for t in trabajadores:
+                t.start()
+            for t in trabajadores:
+                t.join()
+            duracion = time.perf_counter() - inicio
+
+            db.session.expire_all()
+            finales = {producto_id: db.session.get(Producto, producto_id).stock for producto_id in vendidas}
+        finally:
+            #Los productos de prueba se borran aunque el benchmark falle o se interrumpa
+            db.session.rollback()
+            Producto.query.filter(Producto.id.in_([suelto_id, carrito_id])).delete(synchronize_session=False)
+            TipoProducto.query.filter_by(id=tipo_id).delete(synchronize_session=False)
+            db.session.commit()
+
+    click.echo(f'{hilos} hilos x {intentos} intentos en {duracion:.2f}s '
+               f'({hilos * intentos / duracion:.0f} operaciones/s).')
+    for nombre, producto_id in (('Suelto + carrito', suelto_id), ('Solo carrito', carrito_id)):
+        click.echo(f'{nombre}: vendidas {sum(vendidas[producto_id])}, stock final {finales[producto_id]}.')
+    click.echo(f'Rechazadas por falta de stock: {sum(rechazadas)}.')
+    for error in errores:
+        click.echo(f'Error en un hilo: {error}')
+
+    if any(finales[p] < 0 or sum(vendidas[p]) + finales[p] != stock for p in finales):
+        raise click.ClickException('El stock no cuadra con las unidades vendidas.')
+    click.echo('Correcto: ninguna venta se perdió y el stock nunca quedó negativo.')
+
+# --- ETIQUETAS PRECALCULADAS DE LOS PRODUCTOS ---
+@click.command(name='regenerar-etiquetas')
+@with_appcontext
+def regenerar_etiquetas():
+    """Recalcula la etiqueta de atributos de todos los productos."""
+    from app.utils.etiquetas import regenerar_etiquetas as regenerar
+
+    regenerar(db.session)
+    db.session.commit()
+    click.echo('Etiquetas de productos regeneradas.')
+
+# --- ALMACENAMIENTO DE ATRIBUTOS (EAV / JSON) ---
+@click.command(name='sincronizar-atributos')
+@click.option('--desde', type=click.Choice(['eav', 'json']), default='eav', show_default=True,
+              help='Copia de referencia: eav reescribe producto.atributos_json; json reconstruye las filas de valor_atributo_producto.')
+@with_appcontext
+def sincronizar_atributos(desde):
+    """Copia los atributos de producto de un almacenamiento al otro (antes de cambiar ATRIBUTOS_ALMACENAMIENTO)."""
+    from app.models.producto import Producto
+    from app.models.atributo import Atributo
+    from app.models.valor_atributo_producto import ValorAtributoProducto
+
+    producto_ids = db.session.execute(db.select(Producto.id).order_by(Producto.id)).scalars().all()
+    #El JSON puede conservar claves de atributos ya eliminados; esas no se pasan a filas EAV
+    atributo_ids = set(db.session.execute(db.select(Atributo.id)).scalars())
+    for inicio in range(0, len(producto_ids), 500):
+        bloque = producto_ids[inicio:inicio + 500]
+        if desde == 'eav':
+            datos = {producto_id: {} for producto_id in bloque}
+            filas = db.session.execute(
+                db.select(ValorAtributoProducto.producto_id, ValorAtributoProducto.atributo_id, ValorAtributoProducto.valor)
+                .where(ValorAtributoProducto.producto_id.in_(bloque))
+            )
+            for producto_id, atributo_id, valor in filas:
+                datos[producto_id][str(atributo_id)] = valor
+            db.session.execute(db.update(Producto), [
+                {'id': producto_id, 'atributos_json': valores} for producto_id, valores in datos.items()
+            ])
+        else:
+            filas = db.session.execute(
+                db.select(Producto.id, Producto.atributos_json)
+                .where(Producto.id.in_(bloque), Producto.atributos_json.isnot(None))
+            ).all()
+            db.session.execute(db.delete(ValorAtributoProducto).where(
+                ValorAtributoProducto.producto_id.in_([producto_id for producto_id, _ in filas])
+            ))
+            nuevas = [{'producto_id': producto_id, 'atributo_id': int(atributo_id), 'valor': valor}
+                      for producto_id, datos in filas for atributo_id, valor in datos.items()
+                      if int(atributo_id) in atributo_ids]
+            if nuevas:
+                db.session.execute(db.insert(ValorAtributoProducto), nuevas)
+    db.session.commit()
+    click.echo(f'Atributos de {len(producto_ids)} productos copiados desde {desde}.')
+
+# --- COSTE DE RENDERIZAR DOCUMENTOS ---
+@click.command(name='benchmark-documentos')
+@click.option('--venta', 'venta_id', type=int, default=None, help='Venta cuyo recibo se renderiza. Por defecto, la última.')
+@click.option('--repeticiones', default=20, show_default=True, help='Documentos que se renderizan en cada modo.')
+@with_appcontext
+def benchmark_documentos(venta_id, repeticiones):
+    """Tiempo por recibo en PDF preparando WeasyPrint desde cero en cada documento frente al contexto reutilizable del proceso."""
+    import time
+    from flask import render_template
+    from weasyprint import HTML, CSS
+    from app.models.configuracion import Configuracion
+    from app.utils import documentos, exportacion
+
+    venta = db.session.get(Venta, venta_id) if venta_id else Venta.query.order_by(Venta.id.desc()).first()
+    if venta is None:
+        raise click.ClickException('No hay ventas con las que generar un recibo.')
+    contexto = exportacion.contexto_documento(venta, Configuracion.obtener_config())
+    html = render_template('admin/receipts/receipt_template.html', **contexto)
+    base_url = documentos.base_url_estaticos()
+
+    def medir(renderizar):
+        #La primera vuelta (importaciones, primera carga de fuentes) no cuenta
+        renderizar()
+        inicio = time.perf_counter()
+        for _ in range(repeticiones):
+            renderizar()
+        return (time.perf_counter() - inicio) / repeticiones
+
+    inicio = time.perf_counter()
+    documentos.contexto_renderizado()
+    preparacion = time.perf_counter() - inicio
+
+    desde_cero = medir(lambda: HTML(string=html, base_url=base_url).write_pdf(stylesheets=[CSS(string=documentos.ESTILO_PAGINA)]))
+    con_contexto = medir(lambda: documentos.renderizar_pdf(html, base_url))
+    click.echo(f'Recibo de la venta #{venta.id}, {repeticiones} repeticiones.')
+    click.echo(f'Desde cero:   {desde_cero * 1000:.1f} ms por documento.')
+    click.echo(f'Con contexto: {con_contexto * 1000:.1f} ms por documento '
+               f'({preparacion * 1000:.1f} ms para preparar el contexto, una vez por proceso).')
+    if con_contexto:
+        click.echo(f'Mejora: x{desde_cero / con_contexto:.2f}.')
+
+# --- EXPORTACIÓN DE DOCUMENTOS POR LOTES ---
+@click.command(name='exportar-documentos')
+@click.option('--tipo', type=click.Choice(['estado_cuenta', 'factura']), default='estado_cuenta', show_default=True,
+              help='estado_cuenta: ventas a crédito; factura: ventas pagadas.')
+@click.option('--desde', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Primer día de venta (YYYY-MM-DD).')
+@click.option('--hasta', type=click.DateTime(formats=['%Y-%m-%d']), default=None, help='Último día de venta (YYYY-MM-DD).')
+@click.option('--cliente', 'cliente_id', type=int, default=None, help='Solo las ventas de este cliente (id).')
+@click.option('--formato', type=click.Choice(['zip', 'pdf']), default='zip', show_default=True,
+              help='zip: un PDF por venta; pdf: todos en un solo PDF.')
+@click.option('--salida', type=click.Path(dir_okay=False, writable=True), default=None,
+              help='Archivo de destino. Por defecto, p. ej. estados_cuenta_<desde>_<hasta>.zip en el directorio actual.')
+@with_appcontext
+def exportar_documentos(tipo, desde, hasta, cliente_id, formato, salida):
+    """Genera de una vez las facturas o estados de cuenta de un rango de fechas o de un cliente."""
+    import time
+    from app.utils import exportacion
+
+    desde = desde.date() if desde else None
+    hasta = hasta.date() if hasta else None
+    salida = salida or exportacion.nombre_archivo(tipo, formato, desde, hasta)
+
+    def progreso(hechos, total):
+        if hechos == total or hechos % 25 == 0:
+            click.echo(f'{hechos}/{total} documentos...')
+
+    inicio = time.perf_counter()
+    try:
+        total = exportacion.exportar(salida, tipo, formato, desde, hasta, cliente_id, progreso=progreso)
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    click.echo(f'{total} documento(s) exportado(s) a {salida} en {time.perf_counter() - inicio:.1f}s.')
+
 def init_app(app):
     app.cli.add_command(crear_admin_auto)
-    app.cli.add_command(crear_admin_manual)
\ No newline at end of file
+    app.cli.add_command(crear_admin_manual)
+    app.cli.add_command(reconstruir_resumenes)
+    app.cli.add_command(conciliar_saldos)
+    app.cli.add_command(benchmark_stock)
+    app.cli.add_command(regenerar_etiquetas)
+    app.cli.add_command(sincronizar_atributos)
+    app.cli.add_command(benchmark_documentos)
+    app.cli.add_command(exportar_documentos)
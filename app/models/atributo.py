@@ -1,4 +1,9 @@
 from app import db
+from app.utils.cache import CacheResultados
+
+#Mapa nombre -> id de los atributos de cada tipo, por (tipo_id, version_esquema): la versión cambia cuando
+#otro proceso modifica los atributos, y los commits de este proceso además descartan la entrada
+cache_atributos = CacheResultados(max_entradas=512, ttl=3600)
 
 class Atributo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -14,6 +19,21 @@ class Atributo(db.Model):
     def __repr__(self):
         return f'<Atributo {self.nombre_atributo}>'
 
+    @classmethod
+    def ids_por_nombre(cls, tipo_producto_id):
+        """{nombre_atributo: id} de los atributos de un tipo de producto, cacheado por proceso."""
+        from app.models.tipo_producto import TipoProducto
+        tipo = db.session.get(TipoProducto, tipo_producto_id)
+        if tipo is not None and not isinstance(tipo.version_esquema, int):
+            #Incremento pendiente de marcar_cambio_esquema: el flush lo aplica y expira la columna
+            db.session.flush()
+        version = tipo.version_esquema if tipo is not None else None
+        return cache_atributos.obtener_o_calcular(
+            (tipo_producto_id, version),
+            lambda: dict(db.session.query(cls.nombre_atributo, cls.id).filter_by(tipo_producto_id=tipo_producto_id).all()),
+            dependencias={'atributo'}
+        )
+
 class OpcionAtributo(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     valor_opcion = db.Column(db.String(100), nullable=False)
@@ -1,6 +1,15 @@
+from sqlalchemy import func
+from sqlalchemy.ext.hybrid import hybrid_property
 from app import db
 
 class Cliente(db.Model):
+    __table_args__ = (
+        db.Index('ix_cliente_nombre_id', 'nombre', 'id'),
+        #Búsqueda por prefijo (LIKE 'texto%') de identificación y teléfono; en PostgreSQL con *_pattern_ops
+        db.Index('ix_cliente_identificacion_prefijo', 'identificacion', postgresql_ops={'identificacion': 'varchar_pattern_ops'}),
+        db.Index('ix_cliente_telefono_prefijo', 'telefono', postgresql_ops={'telefono': 'varchar_pattern_ops'}),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(64), nullable=False)
     apellido = db.Column(db.String(64), nullable=True)
@@ -12,4 +21,22 @@ class Cliente(db.Model):
     ventas = db.relationship('Venta', backref='cliente', lazy='dynamic')
 
     def __repr__(self):
-        return f'<Cliente {self.nombre} {self.apellido}>'
\ No newline at end of file
+        return f'<Cliente {self.nombre} {self.apellido}>'
+
+    @hybrid_property
+    def nombre_completo(self):
+        return f"{self.nombre} {self.apellido or ''}"
+
+    @nombre_completo.expression
+    def nombre_completo(cls):
+        #coalesce: sin él, un apellido NULL deja toda la expresión en NULL
+        return cls.nombre + ' ' + func.coalesce(cls.apellido, '')
+
+#Búsqueda por similitud sobre el nombre completo; en PostgreSQL es un índice trigram sobre la expresión
+db.Index('ix_cliente_nombre_completo_trgm', Cliente.nombre_completo.label('nombre_completo'),
+         postgresql_using='gin', postgresql_ops={'nombre_completo': 'gin_trgm_ops'})
+
+#Filtro del listado por prefijo del nombre sin distinguir mayúsculas; en PostgreSQL con text_pattern_ops,
+#que permite resolver lower(nombre) LIKE 'texto%' con el índice
+db.Index('ix_cliente_nombre_prefijo', func.lower(Cliente.nombre).label('nombre_minusculas'),
+         postgresql_ops={'nombre_minusculas': 'text_pattern_ops'})
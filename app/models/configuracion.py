@@ -1,6 +1,23 @@
+import threading
+from flask import g, has_request_context
+from sqlalchemy import inspect
 from app import db
 from decimal import Decimal
 
+#Copia de la configuración compartida por todas las peticiones del proceso
+_cache_config = {'version': None, 'config': None}
+_cache_lock = threading.Lock()
+
+class ConfiguracionCacheada:
+    """Instantánea de solo lectura de la configuración. Para modificarla, usar el modelo."""
+
+    def __init__(self, config):
+        for columna in Configuracion.__table__.columns:
+            setattr(self, columna.key, getattr(config, columna.key))
+
+    def __repr__(self):
+        return f'<ConfiguracionCacheada v{self.version}>'
+
 class Configuracion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre_tienda = db.Column(db.String(100), default='Mi Tienda')
@@ -24,6 +41,46 @@ class Configuracion(db.Model):
     moneda_simbolo = db.Column(db.String(5), nullable=False, default='$')
     pie_pagina_recibo = db.Column(db.Text, nullable=True)
 
+    #Se incrementa en cada cambio para que los demás procesos recarguen su copia
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+
+    def marcar_cambio(self):
+        if not inspect(self).persistent:
+            #Fila nueva: todavía no hay columna que incrementar en el INSERT
+            self.version = 1
+            return
+        #Incremento atómico en SQL: dos administradores guardando a la vez no pierden versiones
+        self.version = Configuracion.version + 1
+
     @staticmethod
     def obtener_config():
-        return Configuracion.query.first()
\ No newline at end of file
+        """Configuración de solo lectura, cacheada por proceso.
+
+        Solo se consulta la columna `version` (una vez por petición) y la fila
+        completa se recarga únicamente cuando otro proceso la ha cambiado.
+        """
+        if has_request_context() and 'tienda_config' in g:
+            return g.tienda_config
+
+        version = db.session.query(Configuracion.version).order_by(Configuracion.id).limit(1).scalar()
+        if version is None:
+            config = None
+        else:
+            with _cache_lock:
+                if _cache_config['version'] != version:
+                    fila = Configuracion.query.order_by(Configuracion.id).first()
+                    _cache_config['config'] = ConfiguracionCacheada(fila)
+                    _cache_config['version'] = fila.version
+                config = _cache_config['config']
+
+        if has_request_context():
+            g.tienda_config = config
+        return config
+
+    @staticmethod
+    def invalidar_cache():
+        with _cache_lock:
+            _cache_config['version'] = None
+            _cache_config['config'] = None
+        if has_request_context():
+            g.pop('tienda_config', None)
\ No newline at end of file
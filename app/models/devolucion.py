@@ -2,8 +2,12 @@ from app import db
 from datetime import datetime
 
 class Devolucion(db.Model):
+    __table_args__ = (
+        db.Index('ix_devolucion_fecha_devolucion_id', 'fecha_devolucion', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id'), nullable=False)
+    venta_id = db.Column(db.Integer, db.ForeignKey('venta.id'), nullable=False, index=True)
     fecha_devolucion = db.Column(db.DateTime, index=True, default=datetime.utcnow)
     motivo = db.Column(db.Text, nullable=True)
     monto_total_devolucion = db.Column(db.Numeric(10, 2), nullable=False)
@@ -2,10 +2,16 @@ from app import db
 from datetime import datetime
 
 class Gasto(db.Model):
+    __table_args__ = (
+        db.Index('ix_gasto_fecha_id', 'fecha', 'id'),
+        db.Index('ix_gasto_categoria_id_fecha_id', 'categoria_id', 'fecha', 'id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     descripcion = db.Column(db.String(255), nullable=False)
     monto = db.Column(db.Numeric(10, 2), nullable=False)
-    fecha = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    #active_history: al cambiar la fecha se carga la anterior, para actualizar también el resumen de ese día
+    fecha = db.column_property(db.Column(db.DateTime, index=True, default=datetime.utcnow), active_history=True)
     categoria_id = db.Column(db.Integer, db.ForeignKey('categoria_gasto.id'), nullable=False)
     categoria = db.relationship('CategoriaGasto', back_populates='gastos')
     usuario_id = db.Column(db.Integer, db.ForeignKey('usuario.id'), nullable=False)
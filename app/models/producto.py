@@ -1,7 +1,24 @@
 from app import db
 from datetime import datetime
+from flask import current_app
+from sqlalchemy import update, case
+from sqlalchemy.dialects.postgresql import JSONB
+
+
+def modo_atributos():
+    """'eav', 'dual' o 'json': dónde se leen y escriben los atributos (ATRIBUTOS_ALMACENAMIENTO)."""
+    return current_app.config.get('ATRIBUTOS_ALMACENAMIENTO', 'eav')
+
 
 class Producto(db.Model):
+    #Búsqueda por subcadena (ILIKE '%q%') del buscador de productos; en PostgreSQL son índices trigram
+    __table_args__ = (
+        db.Index('ix_producto_nombre_trgm', 'nombre', postgresql_using='gin', postgresql_ops={'nombre': 'gin_trgm_ops'}),
+        db.Index('ix_producto_etiqueta_atributos_trgm', 'etiqueta_atributos', postgresql_using='gin', postgresql_ops={'etiqueta_atributos': 'gin_trgm_ops'}),
+        #Filtro por facetas en modo 'json': contención JSONB (atributos_json @> '{"3": "M"}')
+        db.Index('ix_producto_atributos_json', 'atributos_json', postgresql_using='gin', postgresql_ops={'atributos_json': 'jsonb_path_ops'}),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(120), nullable=False)
     descripcion = db.Column(db.Text, nullable=True)
@@ -9,19 +26,142 @@ class Producto(db.Model):
     stock = db.Column(db.Integer, nullable=False, default=0)
     fecha_creacion = db.Column(db.DateTime, default=datetime.utcnow)
     tipo_producto_id = db.Column(db.Integer, db.ForeignKey('tipo_producto.id'), nullable=False)
+    #"Atributo: valor, ..." precalculado desde los valores de atributos; lo mantiene app.utils.etiquetas
+    #y se puede regenerar con el comando `flask regenerar-etiquetas`
+    etiqueta_atributos = db.Column(db.Text, nullable=True)
+    #{"<atributo_id>": "valor", ...}: copia de los valores de atributos en la propia fila (JSONB en PostgreSQL,
+    #JSON en texto en SQLite). Se escribe siempre; se lee cuando ATRIBUTOS_ALMACENAMIENTO no es 'eav'
+    atributos_json = db.Column(db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), 'postgresql'), nullable=True)
+    #Búsqueda de texto: en PostgreSQL la columna generada `busqueda` (tsvector) y en SQLite la tabla FTS5
+    #producto_fts; las crea la migración y no se mapean aquí (ver app.utils.busqueda.buscar_productos_texto)
 
-    valores_atributos = db.relationship('ValorAtributoProducto', backref='producto', lazy='dynamic', cascade="all, delete-orphan")
+    valores_atributos = db.relationship('ValorAtributoProducto', backref='producto', cascade="all, delete-orphan")
     ventas_asociadas = db.relationship('VentaProducto', back_populates='producto')
     devoluciones_asociadas = db.relationship('DevolucionProducto', back_populates='producto', lazy='dynamic')
 
     def __repr__(self):
         return f'<Producto {self.nombre}>'
 
+    @property
+    def etiqueta(self):
+        """Texto para listas y buscadores: "Nombre (Atributo: valor, ...)"."""
+        return f'{self.nombre} ({self.etiqueta_atributos})' if self.etiqueta_atributos else self.nombre
+
+    def descontar_stock(self, cantidad):
+        """Descuenta `cantidad` unidades solo si hay suficientes, con un único UPDATE condicional.
+
+        Devuelve False si no alcanzan (p. ej. otra caja vendió las últimas unidades). La fila
+        queda bloqueada hasta el commit, así que dos ventas simultáneas nunca dejan stock negativo.
+        """
+        resultado = db.session.execute(
+            update(Producto)
+            .where(Producto.id == self.id, Producto.stock >= cantidad)
+            .values(stock=Producto.stock - cantidad)
+            .execution_options(synchronize_session=False)
+        )
+        #El valor en memoria ya no es fiable: se vuelve a leer la próxima vez que se consulte
+        db.session.expire(self, ['stock'])
+        return resultado.rowcount == 1
+
+    @classmethod
+    def descontar_stock_lote(cls, cantidades):
+        """Descuenta {producto_id: cantidad} con un único UPDATE condicional.
+
+        Devuelve False si algún producto no tiene stock suficiente; en ese caso pueden haberse
+        descontado los demás y quien llama debe deshacer la transacción.
+        """
+        cantidad = case(cantidades, value=cls.id)
+        resultado = db.session.execute(
+            update(cls)
+            .where(cls.id.in_(cantidades), cls.stock >= cantidad)
+            .values(stock=cls.stock - cantidad)
+            .execution_options(synchronize_session=False)
+        )
+        for obj in list(db.session.identity_map.values()):
+            if isinstance(obj, cls) and obj.id in cantidades:
+                db.session.expire(obj, ['stock'])
+        return resultado.rowcount == len(cantidades)
+
+    def reponer_stock(self, cantidad):
+        """Suma `cantidad` unidades sin leer antes el stock, para no pisar ventas concurrentes."""
+        db.session.execute(
+            update(Producto)
+            .where(Producto.id == self.id)
+            .values(stock=Producto.stock + cantidad)
+            .execution_options(synchronize_session=False)
+        )
+        db.session.expire(self, ['stock'])
+
+    def valores_por_atributo(self):
+        """{atributo_id: valor} del producto.
+
+        Fuera del modo 'eav' salen de atributos_json, sin más consultas que la de la propia fila; los
+        productos que aún no tienen la columna rellenada se leen de valor_atributo_producto.
+        """
+        if modo_atributos() != 'eav' and self.atributos_json is not None:
+            return {int(atributo_id): valor for atributo_id, valor in self.atributos_json.items()}
+        #valores_atributos se carga una sola vez por instancia, así que consultar varios atributos cuesta lo mismo
+        return {valor_obj.atributo_id: valor_obj.valor for valor_obj in self.valores_atributos}
+
+    def guardar_valores_atributos(self, valores):
+        """Guarda {atributo_id: valor}: siempre en atributos_json y, salvo en modo 'json', también como filas EAV."""
+        from app.models.valor_atributo_producto import ValorAtributoProducto
+        valores = {int(atributo_id): str(valor) for atributo_id, valor in valores.items()}
+        #Se asigna un dict nuevo: el ORM no detecta cambios hechos dentro del mismo objeto JSON
+        self.atributos_json = {str(atributo_id): valor for atributo_id, valor in sorted(valores.items())}
+
+        if modo_atributos() == 'json':
+            #Sin copia EAV: mejor ninguna fila que filas desactualizadas (`flask sincronizar-atributos --desde json`)
+            self.valores_atributos = []
+            return
+        #Las filas de atributos que ya no vienen se quitan (delete-orphan), para que ambos almacenes tengan el mismo conjunto
+        self.valores_atributos = [valor_obj for valor_obj in self.valores_atributos if valor_obj.atributo_id in valores]
+        existentes = {valor_obj.atributo_id: valor_obj for valor_obj in self.valores_atributos}
+        for atributo_id, valor in valores.items():
+            if atributo_id in existentes:
+                existentes[atributo_id].valor = valor
+            else:
+                self.valores_atributos.append(ValorAtributoProducto(valor=valor, atributo_id=atributo_id))
+
     def obtener_valor_atributo(self, nombre_atributo):
         from app.models.atributo import Atributo
-        from app.models.valor_atributo_producto import ValorAtributoProducto
-        attr = Atributo.query.filter_by(nombre_atributo=nombre_atributo, tipo_producto_id=self.tipo_producto_id).first()
-        if not attr:
+        atributo_id = Atributo.ids_por_nombre(self.tipo_producto_id).get(nombre_atributo)
+        if atributo_id is None:
             return None
-        valor_obj = ValorAtributoProducto.query.filter_by(producto_id=self.id, atributo_id=attr.id).first()
-        return valor_obj.valor if valor_obj else None
\ No newline at end of file
+        return self.valores_por_atributo().get(atributo_id)
+
+    @classmethod
+    def valores_de_atributo(cls, productos, nombre_atributo):
+        """{producto_id: valor} del atributo `nombre_atributo` para muchos productos, en una sola consulta."""
+        from app.models.atributo import Atributo
+        from app.models.valor_atributo_producto import ValorAtributoProducto
+        atributo_ids = set()
+        for tipo_producto_id in {p.tipo_producto_id for p in productos}:
+            atributo_id = Atributo.ids_por_nombre(tipo_producto_id).get(nombre_atributo)
+            if atributo_id is not None:
+                atributo_ids.add(atributo_id)
+        if not atributo_ids:
+            return {}
+        producto_ids = [p.id for p in productos]
+
+        resultado = {}
+        if modo_atributos() != 'eav':
+            filas = db.session.query(cls.id, cls.atributos_json).filter(
+                cls.id.in_(producto_ids), cls.atributos_json.isnot(None)
+            ).all()
+            for producto_id, datos in filas:
+                for atributo_id in atributo_ids:
+                    if str(atributo_id) in datos:
+                        resultado[producto_id] = datos[str(atributo_id)]
+            #Los que aún no tienen la columna rellenada se leen de las filas EAV
+            con_json = {producto_id for producto_id, _ in filas}
+            producto_ids = [producto_id for producto_id in producto_ids if producto_id not in con_json]
+            if not producto_ids:
+                return resultado
+
+        filas = db.session.query(ValorAtributoProducto.producto_id, ValorAtributoProducto.valor).filter(
+            ValorAtributoProducto.atributo_id.in_(atributo_ids),
+            ValorAtributoProducto.producto_id.in_(producto_ids)
+        ).all()
+        resultado.update(filas)
+        return resultado
\ No newline at end of file
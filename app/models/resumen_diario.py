@@ -0,0 +1,35 @@
+from app import db
+
+#Tablas de resumen diario para el dashboard. Se mantienen desde app.utils.resumenes
+#y se pueden reconstruir con el comando `flask reconstruir-resumenes`.
+
+class ResumenVentaDiaria(db.Model):
+    __tablename__ = 'resumen_venta_diaria'
+    dia = db.Column(db.Date, primary_key=True)
+    estado = db.Column(db.String(20), primary_key=True)
+    numero_ventas = db.Column(db.Integer, nullable=False, default=0)
+    monto_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenVentaDiaria {self.dia} {self.estado}>'
+
+class ResumenProductoDiario(db.Model):
+    __tablename__ = 'resumen_producto_diario'
+    dia = db.Column(db.Date, primary_key=True)
+    estado = db.Column(db.String(20), primary_key=True)
+    #Sin clave foránea: eliminar un producto no debe quedar bloqueado por su historial
+    producto_id = db.Column(db.Integer, primary_key=True, index=True)
+    cantidad = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenProductoDiario {self.dia} Producto {self.producto_id}>'
+
+class ResumenGastoDiario(db.Model):
+    __tablename__ = 'resumen_gasto_diario'
+    dia = db.Column(db.Date, primary_key=True)
+    categoria_id = db.Column(db.Integer, primary_key=True)
+    numero_gastos = db.Column(db.Integer, nullable=False, default=0)
+    monto_total = db.Column(db.Numeric(12, 2), nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ResumenGastoDiario {self.dia} Categoria {self.categoria_id}>'
@@ -4,6 +4,8 @@ from app.models.atributo import Atributo # <-- AÑADE ESTA IMPORTACIÓN
 class TipoProducto(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     nombre = db.Column(db.String(100), unique=True, nullable=False)
+    #Se incrementa al añadir o quitar atributos u opciones, para que cada proceso rehaga su formulario cacheado
+    version_esquema = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     productos = db.relationship('Producto', backref='tipo_producto', lazy='dynamic')
 
@@ -17,4 +19,8 @@ class TipoProducto(db.Model):
     )
 
     def __repr__(self):
-        return f'<TipoProducto {self.nombre}>'
\ No newline at end of file
+        return f'<TipoProducto {self.nombre}>'
+
+    def marcar_cambio_esquema(self):
+        #Incremento atómico en SQL, como Configuracion.marcar_cambio
+        self.version_esquema = TipoProducto.version_esquema + 1
\ No newline at end of file
@@ -1,3 +1,4 @@
+from sqlalchemy import event
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -11,6 +12,8 @@ class Usuario(UserMixin, db.Model):
     rol = db.Column(db.String(20), nullable=False, default='Vendedor') # Roles: 'Vendedor', 'Administrador'
     failed_login_attempts = db.Column(db.Integer, default=0)
     lockout_until = db.Column(db.DateTime, nullable=True)
+    #Se incrementa en cada cambio; load_user la compara para saber si su copia en caché sigue valiendo
+    version = db.Column(db.Integer, nullable=False, default=1, server_default='1')
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
@@ -23,4 +26,9 @@ class Usuario(UserMixin, db.Model):
         return self.rol == 'Administrador'
 
     def __repr__(self):
-        return f'<Usuario {self.nombre} ({self.rol})>'
\ No newline at end of file
+        return f'<Usuario {self.nombre} ({self.rol})>'
+
+@event.listens_for(Usuario, 'before_update')
+def _incrementar_version(mapper, connection, usuario):
+    #Incremento en SQL: dos procesos que modifican al mismo usuario no pierden versiones
+    usuario.version = Usuario.version + 1
@@ -1,6 +1,13 @@
 from app import db
 
 class ValorAtributoProducto(db.Model):
+    __table_args__ = (
+        #Filtrar productos por "atributo = valor" y contar opciones (filtro por facetas)
+        db.Index('ix_valor_atributo_producto_atributo_id_valor', 'atributo_id', 'valor', 'producto_id'),
+        #Valores de un producto, o de un atributo concreto de un producto
+        db.Index('ix_valor_atributo_producto_producto_id_atributo_id', 'producto_id', 'atributo_id'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     valor = db.Column(db.String(255), nullable=False)
 
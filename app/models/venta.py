@@ -2,8 +2,18 @@ from app import db
 from datetime import datetime
 
 class Venta(db.Model):
+    #Índices para la paginación por cursor del listado (fecha_venta, id), con y sin filtros
+    __table_args__ = (
+        db.Index('ix_venta_fecha_venta_id', 'fecha_venta', 'id'),
+        db.Index('ix_venta_estado_fecha_venta_id', 'estado', 'fecha_venta', 'id'),
+        db.Index('ix_venta_cliente_id_fecha_venta_id', 'cliente_id', 'fecha_venta', 'id'),
+        #Cuentas por cobrar: ventas con saldo pendiente
+        db.Index('ix_venta_saldo_pendiente', 'saldo_pendiente'),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
-    fecha_venta = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    #active_history: al cambiar la fecha se carga la anterior, para actualizar también el resumen de ese día
+    fecha_venta = db.column_property(db.Column(db.DateTime, index=True, default=datetime.utcnow), active_history=True)
     monto_total = db.Column(db.Numeric(10, 2), nullable=False)
     estado = db.Column(db.String(20), nullable=False, default='En Proceso') # En Proceso, Pendiente, Pagada, Anulada, Credito, Con Devolucion
 
@@ -19,6 +29,11 @@ class Venta(db.Model):
     frecuencia_cuotas = db.Column(db.String(20), nullable=True)
     abono_inicial = db.Column(db.Numeric(10, 2), nullable=True)
 
+    #Suma de los pagos y lo que falta por cobrar; se mantienen desde app.utils.saldos
+    #y se pueden verificar con el comando `flask conciliar-saldos`
+    total_pagado = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default='0')
+    saldo_pendiente = db.Column(db.Numeric(10, 2), nullable=False, default=0, server_default='0')
+
     #Relaciones
     anulada_por = db.relationship('Usuario')
     pagos = db.relationship('Pago', backref='venta', lazy='dynamic')
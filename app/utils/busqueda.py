@@ -0,0 +1,172 @@
+import re
+import unicodedata
+from collections import Counter
+from sqlalchemy import func, or_, and_, select, case, literal_column, text, inspect as inspeccionar
+from app import db
+from app.models.cliente import Cliente
+from app.models.producto import Producto
+from app.utils.cache import CacheResultados
+
+#Índices de n-gramas en memoria para motores sin pg_trgm; se descartan al confirmar cambios en cliente
+cache_indices = CacheResultados(max_entradas=8, ttl=600)
+
+#Configuración de búsqueda de texto de PostgreSQL (spanish + unaccent) que crea la migración de búsqueda de productos
+CONFIGURACION_TEXTO = 'es_sin_tildes'
+
+#Motor de búsqueda de texto disponible en cada base de datos ('tsvector', 'fts5' o None), por URL
+_motores_texto = {}
+
+#Proporción mínima de trigramas del término presentes en el texto (como word_similarity_threshold de pg_trgm)
+UMBRAL_SIMILITUD = 0.6
+
+
+def normalizar(texto):
+    """Minúsculas y sin tildes."""
+    texto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in texto if not unicodedata.combining(c)).lower()
+
+
+def trigramas(texto):
+    """Trigramas de cada palabra con el mismo relleno que pg_trgm ('  pa', ' pal', ..., 'ra ')."""
+    resultado = set()
+    for palabra in re.findall(r'\w+', normalizar(texto)):
+        palabra = f'  {palabra} '
+        resultado.update(palabra[i:i + 3] for i in range(len(palabra) - 2))
+    return resultado
+
+
+def _escapar_like(texto):
+    return texto.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class IndiceNgramas:
+    """Índice invertido trigrama -> ids, para buscar por similitud sin ayuda de la base de datos."""
+
+    def __init__(self, documentos):
+        self.textos = {}
+        self.ids_por_trigrama = {}
+        for id_documento, texto in documentos:
+            self.textos[id_documento] = normalizar(texto)
+            for trigrama in trigramas(texto):
+                self.ids_por_trigrama.setdefault(trigrama, set()).add(id_documento)
+
+    def buscar(self, termino, limite):
+        """Ids ordenados de mayor a menor similitud con `termino`."""
+        buscados = trigramas(termino)
+        if not buscados:
+            return []
+        comunes = Counter()
+        for trigrama in buscados:
+            comunes.update(self.ids_por_trigrama.get(trigrama, ()))
+        termino = normalizar(termino)
+        puntuados = []
+        for id_documento, cantidad in comunes.items():
+            similitud = cantidad / len(buscados)
+            if similitud >= UMBRAL_SIMILITUD or termino in self.textos[id_documento]:
+                puntuados.append((-similitud, id_documento))
+        return [id_documento for _, id_documento in sorted(puntuados)[:limite]]
+
+
+def _indice_clientes():
+    return cache_indices.obtener_o_calcular(
+        'clientes',
+        lambda: IndiceNgramas(db.session.query(Cliente.id, Cliente.nombre_completo)),
+        dependencias={'cliente'}
+    )
+
+
+def buscar_clientes(termino, limite=10):
+    """Clientes que coinciden con `termino`: primero por prefijo de identificación o teléfono y después
+    por similitud del nombre completo (pg_trgm en PostgreSQL, índice de n-gramas en memoria en otros motores).
+    """
+    termino = termino.strip()
+    if not termino:
+        return []
+
+    encontrados = []
+    #Cédulas, RUC y teléfonos: prefijo exacto, resuelto con los índices *_prefijo
+    if any(c.isdigit() for c in termino):
+        patron = f'{_escapar_like(termino)}%'
+        encontrados = Cliente.query.filter(or_(
+            Cliente.identificacion.like(patron, escape='\\'),
+            Cliente.telefono.like(patron, escape='\\')
+        )).order_by(Cliente.nombre, Cliente.id).limit(limite).all()
+        if len(encontrados) >= limite:
+            return encontrados
+
+    excluir = [c.id for c in encontrados]
+    restantes = limite - len(encontrados)
+    if db.session.get_bind().dialect.name == 'postgresql':
+        #Subcadena (ILIKE) o palabra parecida (%>); ambas usan ix_cliente_nombre_completo_trgm
+        similitud = func.word_similarity(termino, Cliente.nombre_completo)
+        query = Cliente.query.filter(or_(
+            Cliente.nombre_completo.ilike(f'%{_escapar_like(termino)}%', escape='\\'),
+            Cliente.nombre_completo.op('%>')(termino)
+        ))
+        if excluir:
+            query = query.filter(Cliente.id.notin_(excluir))
+        encontrados += query.order_by(similitud.desc(), Cliente.nombre, Cliente.id).limit(restantes).all()
+    else:
+        ids = [i for i in _indice_clientes().buscar(termino, limite + len(excluir)) if i not in excluir][:restantes]
+        if ids:
+            por_id = {c.id: c for c in Cliente.query.filter(Cliente.id.in_(ids))}
+            encontrados += [por_id[i] for i in ids if i in por_id]
+    return encontrados
+
+
+def _motor_texto():
+    """'tsvector' (PostgreSQL), 'fts5' (SQLite) o None si la base de datos no tiene índice de texto."""
+    bind = db.session.get_bind()
+    clave = str(bind.url)
+    if clave not in _motores_texto:
+        inspector = inspeccionar(bind)
+        if bind.dialect.name == 'postgresql':
+            columnas = {c['name'] for c in inspector.get_columns('producto')}
+            _motores_texto[clave] = 'tsvector' if 'busqueda' in columnas else None
+        elif bind.dialect.name == 'sqlite':
+            _motores_texto[clave] = 'fts5' if inspector.has_table('producto_fts') else None
+        else:
+            _motores_texto[clave] = None
+    return _motores_texto[clave]
+
+
+def buscar_productos_texto(termino):
+    """Subconsulta (id, rango) de los productos que contienen todas las palabras de `termino` en su nombre,
+    descripción o atributos; menor rango = más relevante. Devuelve None si el término no tiene palabras.
+
+    Cada palabra se busca también como prefijo ("cami" encuentra "camisa"). En PostgreSQL se usa la columna
+    tsvector producto.busqueda (stemming en español, sin tildes) y en SQLite la tabla FTS5 producto_fts.
+    """
+    palabras = re.findall(r'\w+', normalizar(termino))
+    if not palabras:
+        return None
+
+    motor = _motor_texto()
+    if motor == 'tsvector':
+        consulta = func.to_tsquery(CONFIGURACION_TEXTO, ' & '.join(f'{p}:*' for p in palabras))
+        busqueda = literal_column('producto.busqueda')
+        return (
+            select(Producto.id.label('id'), (-func.ts_rank_cd(busqueda, consulta)).label('rango'))
+            .where(busqueda.op('@@')(consulta))
+            .subquery()
+        )
+    if motor == 'fts5':
+        #Pesos de bm25 por columna: nombre, descripción, atributos
+        return (
+            select(literal_column('rowid').label('id'), literal_column('bm25(producto_fts, 10.0, 1.0, 5.0)').label('rango'))
+            .select_from(text('producto_fts'))
+            .where(text('producto_fts MATCH :consulta').bindparams(consulta=' '.join(f'"{p}"*' for p in palabras)))
+            .subquery()
+        )
+
+    #Sin índice de texto: subcadena en cualquiera de los campos, primero las coincidencias en el nombre.
+    #Aquí la base de datos compara las tildes tal cual, así que se buscan las palabras como se escribieron
+    palabras = re.findall(r'\w+', termino)
+    campos = (Producto.nombre, Producto.descripcion, Producto.etiqueta_atributos)
+    condiciones = [or_(*[campo.ilike(f'%{_escapar_like(p)}%', escape='\\') for campo in campos]) for p in palabras]
+    en_nombre = and_(*[Producto.nombre.ilike(f'%{_escapar_like(p)}%', escape='\\') for p in palabras])
+    return (
+        select(Producto.id.label('id'), case((en_nombre, 0), else_=1).label('rango'))
+        .where(*condiciones)
+        .subquery()
+    )
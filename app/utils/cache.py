@@ -0,0 +1,108 @@
+import threading
+import time
+from collections import OrderedDict
+from sqlalchemy import event
+from app import db
+
+#Clave en session.info con las tablas modificadas durante la transacción en curso
+_CLAVE_TABLAS = 'tablas_modificadas'
+
+#Todas las cachés creadas, para poder invalidarlas desde los eventos de la sesión
+_caches_registradas = []
+
+
+class CacheResultados:
+    """Caché en memoria de cada proceso, con expiración por TTL y desalojo LRU.
+
+    Cada entrada declara los nombres de las tablas de las que depende. Cuando una
+    transacción que modificó alguna de esas tablas se confirma, la entrada se descarta.
+    """
+
+    def __init__(self, max_entradas=256, ttl=300):
+        self.max_entradas = max_entradas
+        self.ttl = ttl
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        _caches_registradas.append(self)
+
+    def obtener(self, clave, por_defecto=None):
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                return por_defecto
+            valor, expira, _ = entrada
+            if expira < time.monotonic():
+                del self._entradas[clave]
+                return por_defecto
+            self._entradas.move_to_end(clave)
+            return valor
+
+    def guardar(self, clave, valor, dependencias=(), ttl=None):
+        expira = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._entradas[clave] = (valor, expira, frozenset(dependencias))
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def obtener_o_calcular(self, clave, funcion, dependencias=(), ttl=None):
+        centinela = object()
+        valor = self.obtener(clave, centinela)
+        if valor is centinela:
+            valor = funcion()
+            self.guardar(clave, valor, dependencias, ttl)
+        return valor
+
+    def invalidar(self, clave):
+        with self._lock:
+            self._entradas.pop(clave, None)
+
+    def invalidar_tablas(self, tablas):
+        with self._lock:
+            claves = [clave for clave, (_, _, deps) in self._entradas.items() if deps & tablas]
+            for clave in claves:
+                del self._entradas[clave]
+
+    def limpiar(self):
+        with self._lock:
+            self._entradas.clear()
+
+
+def _tablas_pendientes(session):
+    return session.info.setdefault(_CLAVE_TABLAS, set())
+
+
+def _registrar_tablas_flush(session, flush_context):
+    tablas = _tablas_pendientes(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        tabla = getattr(obj, '__table__', None)
+        if tabla is not None:
+            tablas.add(tabla.name)
+
+
+def _registrar_tablas_sentencia(orm_execute_state):
+    #UPDATE/DELETE masivos (query.delete(), update(Modelo)...) no pasan por el flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        tabla = getattr(orm_execute_state.statement, 'table', None)
+        if tabla is not None:
+            _tablas_pendientes(orm_execute_state.session).add(tabla.name)
+
+
+def _invalidar_tras_commit(session):
+    tablas = session.info.pop(_CLAVE_TABLAS, None)
+    if tablas:
+        for cache in _caches_registradas:
+            cache.invalidar_tablas(tablas)
+
+
+def _descartar_tablas(session):
+    session.info.pop(_CLAVE_TABLAS, None)
+
+
+def init_app(app):
+    for nombre, funcion in (('after_flush', _registrar_tablas_flush),
+                            ('do_orm_execute', _registrar_tablas_sentencia),
+                            ('after_commit', _invalidar_tras_commit),
+                            ('after_rollback', _descartar_tablas)):
+        if not event.contains(db.session, nombre, funcion):
+            event.listen(db.session, nombre, funcion)
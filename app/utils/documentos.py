@@ -0,0 +1,378 @@
+import hashlib
+import json
+import multiprocessing
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from functools import partial
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+
+#Regla de página común a recibos, facturas y planes de pago
+ESTILO_PAGINA = '@page { size: A4; margin: 0; }'
+
+#Segundos que se conserva el estado de un trabajo terminado
+_VIDA_ESTADOS = 24 * 3600
+
+#Segundos sin latido tras los que un trabajo que corre en un worker web se da por interrumpido
+_LATIDO_MAXIMO = 300
+
+#Recursos (logo, hojas de estilo, fuentes) que guarda en memoria cada contexto de renderizado
+_MAX_RECURSOS = 64
+
+_pool = None
+_pool_lock = threading.Lock()
+
+_contexto = None
+_contexto_lock = threading.Lock()
+
+
+def _clase_fetcher():
+    from urllib.request import url2pathname
+    from weasyprint.urls import URLFetcher, URLFetcherResponse
+
+    class FetcherEnMemoria(URLFetcher):
+        """URLFetcher que guarda en memoria lo que descarga; los archivos locales se vuelven a leer
+        solo si cambia su fecha de modificación.
+        """
+
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self._recursos = OrderedDict()
+
+        def fetch(self, url, headers=None):
+            clave = url
+            if url.startswith('file:'):
+                try:
+                    clave = (url, os.path.getmtime(url2pathname(url.split('?')[0].removeprefix('file:'))))
+                except OSError:
+                    return super().fetch(url, headers)
+            if clave not in self._recursos:
+                respuesta = super().fetch(url, headers)
+                try:
+                    cuerpo = respuesta.read()
+                finally:
+                    respuesta.close()
+                self._recursos[clave] = (respuesta.url, cuerpo, dict(respuesta.headers.items()), respuesta.status)
+                if len(self._recursos) > _MAX_RECURSOS:
+                    self._recursos.popitem(last=False)
+            self._recursos.move_to_end(clave)
+            url_final, cuerpo, cabeceras, estado = self._recursos[clave]
+            return URLFetcherResponse(url_final, cuerpo, cabeceras, estado)
+
+    return FetcherEnMemoria
+
+
+class ContextoRenderizado:
+    """Lo que WeasyPrint puede reutilizar entre documentos dentro de un proceso: la hoja de estilo de
+    página ya analizada, una sola FontConfiguration y los recursos leídos (logo, @import de fuentes)
+    guardados en memoria.
+    """
+
+    def __init__(self):
+        from weasyprint import CSS
+        from weasyprint.text.fonts import FontConfiguration
+
+        self.fuentes = FontConfiguration()
+        self.fetcher = _clase_fetcher()()
+        self.estilos = [CSS(string=ESTILO_PAGINA, font_config=self.fuentes, url_fetcher=self.fetcher)]
+        #WeasyPrint no garantiza poder compartir la configuración de fuentes entre hilos
+        self._lock = threading.Lock()
+
+    def renderizar_pdf(self, html, base_url):
+        from weasyprint import HTML
+
+        with self._lock:
+            return HTML(string=html, base_url=base_url, url_fetcher=self.fetcher).write_pdf(
+                stylesheets=self.estilos, font_config=self.fuentes
+            )
+
+
+def contexto_renderizado():
+    """El ContextoRenderizado de este proceso, creado la primera vez que se necesita."""
+    global _contexto
+    with _contexto_lock:
+        if _contexto is None:
+            _contexto = ContextoRenderizado()
+        return _contexto
+
+
+def url_archivo(ruta):
+    """URL file:// de una ruta local; WeasyPrint la lee del disco (o de la memoria del contexto)."""
+    return Path(ruta).resolve().as_uri()
+
+
+def url_logo(config):
+    """URL del logo de la tienda para las plantillas de documentos, o None si no hay logo."""
+    if config and config.logo_path:
+        return url_archivo(os.path.join(current_app.static_folder, config.logo_path))
+    return None
+
+
+def base_url_estaticos():
+    """Base para las rutas relativas de las plantillas: la carpeta static, sin pasar por HTTP."""
+    return url_archivo(current_app.static_folder) + '/'
+
+
+def renderizar_pdf(html, base_url):
+    """HTML -> PDF (WeasyPrint), en memoria."""
+    return contexto_renderizado().renderizar_pdf(html, base_url)
+
+
+def _unir_paginas(paginas):
+    """Una sola imagen con todas las páginas, una debajo de otra."""
+    from PIL import Image
+    imagen = Image.new('RGB', (max(p.width for p in paginas), sum(p.height for p in paginas)), 'white')
+    y = 0
+    for pagina in paginas:
+        imagen.paste(pagina, (0, y))
+        y += pagina.height
+    return imagen
+
+
+def renderizar_png(html, base_url, ruta_salida, dpi=200):
+    """HTML -> PDF (WeasyPrint) -> PNG (pdf2image, a `dpi` puntos por pulgada) en `ruta_salida`.
+
+    Si el documento ocupa varias páginas (p. ej. un plan de pagos largo), el PNG las incluye todas.
+    """
+    from pdf2image import convert_from_bytes
+
+    paginas = convert_from_bytes(renderizar_pdf(html, base_url), dpi=dpi)
+    if paginas:
+        imagen = paginas[0] if len(paginas) == 1 else _unir_paginas(paginas)
+        #Se escribe en un temporal y se renombra: nadie llega a servir un PNG a medias
+        temporal = f'{ruta_salida}.{os.getpid()}.tmp'
+        imagen.save(temporal, 'PNG')
+        os.replace(temporal, ruta_salida)
+
+
+def escribir_estado(ruta_estado, datos):
+    temporal = f'{ruta_estado}.{os.getpid()}.tmp'
+    with open(temporal, 'w', encoding='utf-8') as archivo:
+        json.dump(datos, archivo)
+    os.replace(temporal, ruta_estado)
+
+
+def escribir_latido(ruta_estado, **datos):
+    """Estado 'pendiente' de un trabajo que corre en este proceso, con su pid y la hora del latido.
+
+    estado_trabajo() da el trabajo por interrumpido si el proceso ya no existe o pasan más de
+    _LATIDO_MAXIMO segundos sin otro latido (p. ej. gunicorn reinició el worker).
+    """
+    escribir_estado(ruta_estado, dict(datos, estado='pendiente', pid=os.getpid(), latido=time.time()))
+
+
+def _proceso_activo(estado):
+    if time.time() - estado['latido'] > _LATIDO_MAXIMO:
+        return False
+    try:
+        os.kill(estado['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        #Existe, aunque sea de otro usuario
+        pass
+    return True
+
+
+def huella_documento(html, archivos=(), extras=()):
+    """sha256 de lo que determina un documento: el HTML renderizado, la fecha de modificación de los
+    archivos de los que depende (plantilla, logo) y otros valores como la versión de la configuración.
+    """
+    huella = hashlib.sha256(html.encode('utf-8'))
+    for ruta in archivos:
+        mtime = os.path.getmtime(ruta) if ruta and os.path.exists(ruta) else None
+        huella.update(f'\0{ruta}:{mtime}'.encode('utf-8'))
+    for extra in extras:
+        huella.update(f'\0{extra}'.encode('utf-8'))
+    return huella.hexdigest()
+
+
+def _ejecutar_trabajo(html, base_url, ruta_salida, ruta_estado, resultado, reemplaza=(), dpi=200):
+    """Se ejecuta en un proceso del pool; el estado queda en disco para cualquier worker de gunicorn."""
+    #Desde aquí el trabajo depende de este proceso, no del worker que lo encoló
+    escribir_latido(ruta_estado)
+    try:
+        renderizar_png(html, base_url, ruta_salida, dpi)
+    except Exception as e:
+        escribir_estado(ruta_estado, {'estado': 'error', 'mensaje': str(e)})
+        raise
+    #Versiones anteriores del mismo documento, ya obsoletas
+    for ruta in reemplaza:
+        try:
+            os.remove(ruta)
+        except FileNotFoundError:
+            pass
+    escribir_estado(ruta_estado, dict(resultado, estado='listo'))
+
+
+def _precalentar():
+    #Importar WeasyPrint (Pango, fuentes) y pdf2image y preparar el contexto cuesta; cada proceso lo hace una vez al arrancar
+    import pdf2image  # noqa: F401
+    contexto_renderizado()
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            #'spawn': los procesos no heredan conexiones ni estado de la aplicación
+            _pool = ProcessPoolExecutor(
+                max_workers=current_app.config['DOCUMENTOS_PROCESOS'],
+                mp_context=multiprocessing.get_context('spawn'),
+                initializer=_precalentar
+            )
+        return _pool
+
+
+def iniciar_pool(app):
+    """Arranca ya los DOCUMENTOS_PROCESOS procesos del pool y los precalienta.
+
+    Lo llama gunicorn al iniciar cada worker (gunicorn.conf.py), para que el primer documento no pague el
+    arranque de los procesos ni la importación de WeasyPrint. Cada worker tiene su propio pool.
+    """
+    procesos = app.config['DOCUMENTOS_PROCESOS']
+    if not procesos:
+        return
+    with app.app_context():
+        pool = _obtener_pool()
+    #ProcessPoolExecutor crea un proceso por tarea recibida mientras no tenga ninguno libre
+    for _ in range(procesos):
+        pool.submit(_precalentar)
+
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _directorio_estados():
+    directorio = os.path.join(current_app.instance_path, 'trabajos_documentos')
+    os.makedirs(directorio, exist_ok=True)
+    return directorio
+
+
+def _limpiar_trabajos(directorio):
+    limite = time.time() - _VIDA_ESTADOS
+    for entrada in os.scandir(directorio):
+        if entrada.is_file() and entrada.stat().st_mtime < limite:
+            try:
+                os.remove(entrada.path)
+            except FileNotFoundError:
+                pass
+
+
+def crear_trabajo():
+    """Registra un trabajo pendiente y devuelve (id, ruta de su archivo de estado).
+
+    El primer latido es de este proceso: si muere antes de que el trabajo empiece, estado_trabajo() lo
+    da por interrumpido.
+    """
+    directorio = _directorio_estados()
+    _limpiar_trabajos(directorio)
+    trabajo_id = uuid.uuid4().hex
+    ruta_estado = os.path.join(directorio, f'{trabajo_id}.json')
+    escribir_latido(ruta_estado)
+    return trabajo_id, ruta_estado
+
+
+def ruta_trabajo(trabajo_id, extension):
+    """Ruta de un archivo del trabajo (estado, exportación...) o None si el id no es válido.
+
+    Los archivos de los trabajos se borran pasadas 24 horas.
+    """
+    if not re.fullmatch(r'[0-9a-f]{32}', trabajo_id):
+        return None
+    return os.path.join(_directorio_estados(), f'{trabajo_id}.{extension}')
+
+
+def _al_terminar(futuro, ruta_estado, logger):
+    error = 'cancelado' if futuro.cancelled() else futuro.exception()
+    if error is None:
+        return
+    logger.error(f'Error al generar el documento {os.path.basename(ruta_estado)}: {error}')
+    if futuro.cancelled() or isinstance(error, BrokenProcessPool):
+        #El proceso no llegó a escribir el estado; sin esto la página esperaría para siempre
+        escribir_estado(ruta_estado, {'estado': 'error', 'mensaje': 'El proceso de renderizado terminó inesperadamente.'})
+
+
+def encolar(html, base_url, ruta_salida, resultado, reemplaza=()):
+    """Renderiza `html` como PNG en `ruta_salida` en un proceso del pool y devuelve el id del trabajo.
+
+    `resultado` (p. ej. la URL del PNG) se devuelve en estado_trabajo() cuando el trabajo termina; los
+    archivos de `reemplaza` se borran cuando el nuevo está listo.
+    Con DOCUMENTOS_PROCESOS = 0 se renderiza en la propia petición y el trabajo ya está listo al volver.
+    La resolución del PNG es DOCUMENTOS_PNG_DPI.
+    """
+    dpi = current_app.config['DOCUMENTOS_PNG_DPI']
+    trabajo_id, ruta_estado = crear_trabajo()
+
+    if not current_app.config['DOCUMENTOS_PROCESOS']:
+        _ejecutar_trabajo(html, base_url, ruta_salida, ruta_estado, resultado, reemplaza, dpi)
+        return trabajo_id
+
+    argumentos = (_ejecutar_trabajo, html, base_url, ruta_salida, ruta_estado, resultado, tuple(reemplaza), dpi)
+    try:
+        futuro = _obtener_pool().submit(*argumentos)
+    except BrokenProcessPool:
+        #Un proceso murió (p. ej. por falta de memoria): se descarta el pool y se crea otro
+        _descartar_pool()
+        futuro = _obtener_pool().submit(*argumentos)
+    futuro.add_done_callback(partial(_al_terminar, ruta_estado=ruta_estado, logger=current_app.logger))
+    return trabajo_id
+
+
+def estado_trabajo(trabajo_id):
+    """{'estado': 'pendiente' | 'listo' | 'error', ...} o None si el trabajo no existe."""
+    ruta_estado = ruta_trabajo(trabajo_id, 'json')
+    if ruta_estado is None:
+        return None
+    try:
+        with open(ruta_estado, encoding='utf-8') as archivo:
+            estado = json.load(archivo)
+    except FileNotFoundError:
+        return None
+    if estado.get('estado') == 'pendiente' and 'latido' in estado and not _proceso_activo(estado):
+        #El proceso murió sin escribir el resultado; sin esto la página esperaría para siempre
+        estado = {'estado': 'error', 'mensaje': 'El proceso que lo preparaba terminó inesperadamente.'}
+        escribir_estado(ruta_estado, estado)
+    return estado
+
+
+def renderizar_lote(htmls, base_url):
+    """Convierte cada (nombre, html) de `htmls` en (nombre, pdf), en el mismo orden, usando el pool.
+
+    Solo hay unos pocos documentos en vuelo a la vez: ni los HTML ni los PDF de un lote grande llegan a
+    estar todos en memoria. Con DOCUMENTOS_PROCESOS = 0 se renderizan en este proceso.
+    """
+    procesos = current_app.config['DOCUMENTOS_PROCESOS']
+    if not procesos:
+        for nombre, html in htmls:
+            yield nombre, renderizar_pdf(html, base_url)
+        return
+
+    pool = _obtener_pool()
+    en_vuelo = deque()
+    try:
+        for nombre, html in htmls:
+            en_vuelo.append((nombre, pool.submit(renderizar_pdf, html, base_url)))
+            if len(en_vuelo) >= 2 * procesos:
+                nombre, futuro = en_vuelo.popleft()
+                yield nombre, futuro.result()
+        while en_vuelo:
+            nombre, futuro = en_vuelo.popleft()
+            yield nombre, futuro.result()
+    except BrokenProcessPool:
+        _descartar_pool()
+        raise
+    finally:
+        for _, futuro in en_vuelo:
+            futuro.cancel()
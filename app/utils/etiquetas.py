@@ -0,0 +1,105 @@
+from sqlalchemy import event, select, update, inspect
+from app import db
+from app.models.producto import Producto, modo_atributos
+from app.models.atributo import Atributo
+from app.models.valor_atributo_producto import ValorAtributoProducto
+
+#Clave en session.info con los productos/tipos cuyas etiquetas hay que regenerar al confirmar
+_CLAVE_PENDIENTES = 'etiquetas_pendientes'
+
+_TAMANO_BLOQUE = 500
+
+
+def regenerar_etiquetas(session, producto_ids=None):
+    """Recalcula Producto.etiqueta_atributos ("Atributo: valor, ...") de los productos indicados (o de todos)."""
+    if producto_ids is None:
+        producto_ids = session.execute(select(Producto.id)).scalars().all()
+    producto_ids = sorted(set(producto_ids))
+
+    for inicio in range(0, len(producto_ids), _TAMANO_BLOQUE):
+        bloque = producto_ids[inicio:inicio + _TAMANO_BLOQUE]
+        partes = {producto_id: [] for producto_id in bloque}
+        desde_eav = bloque
+        if modo_atributos() != 'eav':
+            desde_eav = _partes_desde_json(session, bloque, partes)
+        if desde_eav:
+            filas = session.execute(
+                select(ValorAtributoProducto.producto_id, Atributo.nombre_atributo, ValorAtributoProducto.valor)
+                .join(Atributo, ValorAtributoProducto.atributo_id == Atributo.id)
+                .where(ValorAtributoProducto.producto_id.in_(desde_eav))
+                .order_by(ValorAtributoProducto.producto_id, Atributo.id)
+            )
+            for producto_id, nombre_atributo, valor in filas:
+                partes[producto_id].append(f'{nombre_atributo}: {valor}')
+
+        session.execute(update(Producto), [
+            {'id': producto_id, 'etiqueta_atributos': ', '.join(textos) or None}
+            for producto_id, textos in partes.items()
+        ])
+
+
+def _partes_desde_json(session, bloque, partes):
+    """Rellena `partes` con los productos del bloque que tienen atributos_json; devuelve los que no."""
+    filas = session.execute(
+        select(Producto.id, Producto.atributos_json)
+        .where(Producto.id.in_(bloque), Producto.atributos_json.isnot(None))
+    ).all()
+    atributo_ids = {int(atributo_id) for _, datos in filas for atributo_id in datos}
+    nombres = dict(session.execute(
+        select(Atributo.id, Atributo.nombre_atributo).where(Atributo.id.in_(atributo_ids))
+    ).all()) if atributo_ids else {}
+    for producto_id, datos in filas:
+        #Mismo orden que con las filas EAV (por id de atributo); se omiten atributos ya eliminados
+        for atributo_id in sorted(int(a) for a in datos):
+            if atributo_id in nombres:
+                partes[producto_id].append(f'{nombres[atributo_id]}: {datos[str(atributo_id)]}')
+    con_json = {producto_id for producto_id, _ in filas}
+    return [producto_id for producto_id in bloque if producto_id not in con_json]
+
+
+def _registrar_cambios(session, flush_context):
+    pendientes = session.info.setdefault(_CLAVE_PENDIENTES, {'productos': set(), 'tipos': set()})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, ValorAtributoProducto):
+            pendientes['productos'].update(
+                h for h in (inspect(obj).attrs.producto_id.history.deleted or []) if h
+            )
+            if obj.producto_id is not None:
+                pendientes['productos'].add(obj.producto_id)
+        elif isinstance(obj, Producto) and obj not in session.deleted:
+            if inspect(obj).attrs.atributos_json.history.has_changes():
+                pendientes['productos'].add(obj.id)
+        elif isinstance(obj, Atributo):
+            renombrado = inspect(obj).attrs.nombre_atributo.history.has_changes()
+            if (obj in session.deleted or renombrado) and obj.tipo_producto_id is not None:
+                pendientes['tipos'].add(obj.tipo_producto_id)
+
+
+def _actualizar_etiquetas(session):
+    #El commit aún no ha hecho su último flush; lo forzamos para conocer todos los cambios
+    session.flush()
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if not pendientes or not (pendientes['productos'] or pendientes['tipos']):
+        return
+
+    producto_ids = set(pendientes['productos'])
+    if pendientes['tipos']:
+        producto_ids.update(session.execute(
+            select(Producto.id).where(Producto.tipo_producto_id.in_(pendientes['tipos']))
+        ).scalars())
+    #Solo los que siguen existiendo
+    producto_ids = session.execute(select(Producto.id).where(Producto.id.in_(producto_ids))).scalars().all()
+    if producto_ids:
+        regenerar_etiquetas(session, producto_ids)
+
+
+def _descartar_pendientes(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
+
+
+def init_app(app):
+    for nombre, funcion in (('after_flush', _registrar_cambios),
+                            ('before_commit', _actualizar_etiquetas),
+                            ('after_rollback', _descartar_pendientes)):
+        if not event.contains(db.session, nombre, funcion):
+            event.listen(db.session, nombre, funcion)
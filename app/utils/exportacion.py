@@ -0,0 +1,141 @@
+import os
+import shutil
+import subprocess
+import tempfile
+import threading
+import zipfile
+from datetime import datetime, date, timedelta
+from flask import current_app, render_template
+from app import db
+from app.models.venta import Venta
+from app.models.pago import Pago
+from app.models.configuracion import Configuracion
+from app.utils import documentos
+
+#Documentos que se pueden exportar por lotes: plantilla, prefijo de cada archivo y nombre del lote
+TIPOS = {
+    'factura': ('admin/receipts/invoice_template.html', 'factura_venta', 'facturas'),
+    'estado_cuenta': ('admin/receipts/estado_cuenta_template.html', 'estado_cuenta_venta', 'estados_cuenta'),
+}
+FORMATOS = ('zip', 'pdf')
+
+#Ventas cuyas plantillas se renderizan con una misma carga desde la base de datos
+_BLOQUE = 50
+
+
+def contexto_documento(venta, config):
+    """Variables de las plantillas de recibo, estado de cuenta y factura de una venta."""
+    return dict(
+        venta=venta,
+        pagos=venta.pagos.order_by(Pago.fecha_pago.asc()).all(),
+        total_pagado=venta.total_pagado,
+        tienda_config=config,
+        logo_url=documentos.url_logo(config),
+        now=datetime.utcnow()
+    )
+
+
+def consultar_ventas(tipo, desde=None, hasta=None, cliente_id=None):
+    """Ventas con documento de `tipo` en el rango de fechas (ambos días incluidos) y, si se indica, del cliente."""
+    if tipo == 'factura':
+        query = Venta.query.filter(Venta.estado == 'Pagada')
+    else:
+        query = Venta.query.filter(Venta.tipo_pago == 'Credito', Venta.estado.notin_(['En Proceso', 'Anulada']))
+    if desde:
+        query = query.filter(Venta.fecha_venta >= datetime.combine(desde, datetime.min.time()))
+    if hasta:
+        query = query.filter(Venta.fecha_venta < datetime.combine(hasta + timedelta(days=1), datetime.min.time()))
+    if cliente_id:
+        query = query.filter(Venta.cliente_id == cliente_id)
+    return query.order_by(Venta.fecha_venta, Venta.id)
+
+
+def nombre_archivo(tipo, formato, desde=None, hasta=None):
+    """p. ej. facturas_2026-09-01_2026-09-30.zip"""
+    return f"{TIPOS[tipo][2]}_{desde or 'inicio'}_{hasta or date.today()}.{formato}"
+
+
+def _htmls(venta_ids, tipo):
+    template_name, prefijo, _ = TIPOS[tipo]
+    for inicio in range(0, len(venta_ids), _BLOQUE):
+        bloque = venta_ids[inicio:inicio + _BLOQUE]
+        config = Configuracion.obtener_config()
+        ventas = {v.id: v for v in Venta.query.filter(Venta.id.in_(bloque))}
+        for venta_id in bloque:
+            venta = ventas[venta_id]
+            yield f'{prefijo}_{venta.id}.pdf', render_template(template_name, **contexto_documento(venta, config))
+        #Lo ya renderizado no se vuelve a usar; así la sesión no crece con el lote
+        db.session.expunge_all()
+
+
+def exportar(salida, tipo, formato, desde=None, hasta=None, cliente_id=None, progreso=None):
+    """Escribe en el archivo `salida` los documentos de las ventas que cumplen los filtros: un ZIP con un PDF
+    por venta o un solo PDF con todos ellos. Devuelve cuántos documentos se exportaron.
+
+    Cada PDF se escribe en disco en cuanto está listo, así que la memoria no depende del tamaño del lote.
+    `progreso(hechos, total)` se llama tras cada documento.
+    """
+    venta_ids = consultar_ventas(tipo, desde, hasta, cliente_id).with_entities(Venta.id).all()
+    venta_ids = [venta_id for venta_id, in venta_ids]
+    if not venta_ids:
+        raise ValueError('No hay ventas con documentos que exportar para esos filtros.')
+    total = len(venta_ids)
+    pdfs = documentos.renderizar_lote(_htmls(venta_ids, tipo), documentos.base_url_estaticos())
+
+    temporal = f'{salida}.{os.getpid()}.tmp'
+    try:
+        if formato == 'zip':
+            #Los PDF ya van comprimidos: se guardan tal cual
+            with zipfile.ZipFile(temporal, 'w', zipfile.ZIP_STORED) as archivo_zip:
+                for hechos, (nombre, pdf) in enumerate(pdfs, 1):
+                    archivo_zip.writestr(nombre, pdf)
+                    if progreso:
+                        progreso(hechos, total)
+        else:
+            with tempfile.TemporaryDirectory() as directorio:
+                rutas = []
+                for hechos, (nombre, pdf) in enumerate(pdfs, 1):
+                    rutas.append(os.path.join(directorio, nombre))
+                    with open(rutas[-1], 'wb') as archivo:
+                        archivo.write(pdf)
+                    if progreso:
+                        progreso(hechos, total)
+                if len(rutas) == 1:
+                    shutil.copyfile(rutas[0], temporal)
+                else:
+                    #pdfunite viene con poppler-utils, que ya hace falta para pdf2image
+                    subprocess.run(['pdfunite', *rutas, temporal], check=True, capture_output=True)
+        os.replace(temporal, salida)
+    except BaseException:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+        raise
+    return total
+
+
+def iniciar(tipo, formato, desde=None, hasta=None, cliente_id=None):
+    """Lanza la exportación en segundo plano y devuelve el id del trabajo; su estado se consulta con
+    documentos.estado_trabajo() y el archivo queda en documentos.ruta_trabajo(id, formato).
+    """
+    app = current_app._get_current_object()
+    trabajo_id, ruta_estado = documentos.crear_trabajo()
+    salida = documentos.ruta_trabajo(trabajo_id, formato)
+    resultado = {'formato': formato, 'nombre': nombre_archivo(tipo, formato, desde, hasta)}
+
+    def ejecutar():
+        with app.app_context():
+            try:
+                total = exportar(
+                    salida, tipo, formato, desde, hasta, cliente_id,
+                    progreso=lambda hechos, total: documentos.escribir_latido(ruta_estado, hechos=hechos, total=total)
+                )
+            except Exception as e:
+                app.logger.error(f'Error en la exportación {trabajo_id}: {e}', exc_info=True)
+                documentos.escribir_estado(ruta_estado, {'estado': 'error', 'mensaje': str(e)})
+            else:
+                documentos.escribir_estado(ruta_estado, dict(resultado, estado='listo', total=total))
+            finally:
+                db.session.remove()
+
+    threading.Thread(target=ejecutar, name=f'exportacion-{trabajo_id}', daemon=True).start()
+    return trabajo_id
@@ -0,0 +1,102 @@
+import json
+import logging
+import re
+import time
+from collections import Counter
+from flask import g, request, current_app, has_request_context
+from flask.logging import default_handler
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+#Pila de instantes de inicio en connection.info (una sentencia puede disparar otra)
+_CLAVE_INICIO = 'instrumentacion_inicio'
+
+_ESPACIOS = re.compile(r'\s+')
+#Listas IN expandidas y literales: dos consultas con distinta cantidad de valores tienen la misma forma
+_LISTA_PARAMETROS = re.compile(r'\((?:\s*(?:\?|%\(\w+\)s|%s|:\w+)\s*,?)+\)')
+_NUMEROS = re.compile(r'\b\d+\b')
+
+
+class EstadisticasSQL:
+    """Sentencias ejecutadas durante una petición, agrupadas por forma."""
+
+    def __init__(self):
+        self.consultas = 0
+        self.tiempo = 0.0
+        self.formas = Counter()
+
+    def registrar(self, sentencia, duracion):
+        self.consultas += 1
+        self.tiempo += duracion
+        self.formas[forma_sentencia(sentencia)] += 1
+
+    def repetidas(self, umbral):
+        """Formas ejecutadas al menos `umbral` veces: probables N+1."""
+        return [(forma, n) for forma, n in self.formas.most_common() if n >= umbral]
+
+
+def forma_sentencia(sentencia):
+    forma = _ESPACIOS.sub(' ', sentencia).strip()
+    forma = _LISTA_PARAMETROS.sub('(?)', forma)
+    return _NUMEROS.sub('N', forma)
+
+
+def _antes_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    if has_request_context() and 'sql_stats' in g:
+        conn.info.setdefault(_CLAVE_INICIO, []).append(time.perf_counter())
+
+
+def _despues_de_ejecutar(conn, cursor, sentencia, parametros, contexto, executemany):
+    inicios = conn.info.get(_CLAVE_INICIO)
+    if not inicios:
+        return
+    duracion = time.perf_counter() - inicios.pop()
+    if has_request_context() and 'sql_stats' in g:
+        g.sql_stats.registrar(sentencia, duracion)
+
+
+def _iniciar_peticion():
+    g.sql_stats = EstadisticasSQL()
+
+
+def _finalizar_peticion(response):
+    stats = g.pop('sql_stats', None)
+    if stats is None:
+        return response
+
+    repetidas = stats.repetidas(current_app.config['SQL_INSTRUMENTACION_UMBRAL'])
+    tiempo_ms = round(stats.tiempo * 1000, 2)
+    response.headers['X-SQL-Stats'] = f'consultas={stats.consultas}; tiempo_ms={tiempo_ms}; repetidas={len(repetidas)}'
+
+    registro = {
+        'endpoint': request.endpoint,
+        'metodo': request.method,
+        'estado': response.status_code,
+        'consultas': stats.consultas,
+        'tiempo_ms': tiempo_ms,
+        'repetidas': [{'veces': n, 'sql': forma[:300]} for forma, n in repetidas],
+    }
+    nivel = logging.WARNING if repetidas else logging.INFO
+    logger.log(nivel, 'sql_stats %s', json.dumps(registro, ensure_ascii=False))
+    return response
+
+
+def init_app(app):
+    """Activa la instrumentación solo si SQL_INSTRUMENTACION está habilitado."""
+    if not app.config.get('SQL_INSTRUMENTACION'):
+        return
+
+    for nombre, funcion in (('before_cursor_execute', _antes_de_ejecutar),
+                            ('after_cursor_execute', _despues_de_ejecutar)):
+        if not event.contains(Engine, nombre, funcion):
+            event.listen(Engine, nombre, funcion)
+
+    #Sin configuración de logging propia, las líneas van al mismo destino que los logs de Flask
+    if not logger.handlers and not logging.getLogger().handlers:
+        logger.addHandler(default_handler)
+    logger.setLevel(logging.INFO)
+
+    app.before_request(_iniciar_peticion)
+    app.after_request(_finalizar_peticion)
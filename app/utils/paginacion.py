@@ -0,0 +1,80 @@
+import base64
+import json
+from datetime import datetime
+from sqlalchemy import tuple_
+
+
+class PaginaCursor:
+    """Resultado de una página obtenida por cursor (keyset)."""
+
+    def __init__(self, items, cursor_anterior=None, cursor_siguiente=None):
+        self.items = items
+        self.cursor_anterior = cursor_anterior
+        self.cursor_siguiente = cursor_siguiente
+
+    @property
+    def tiene_anterior(self):
+        return self.cursor_anterior is not None
+
+    @property
+    def tiene_siguiente(self):
+        return self.cursor_siguiente is not None
+
+
+def codificar_cursor(valores):
+    valores = [v.isoformat() if isinstance(v, datetime) else v for v in valores]
+    texto = json.dumps(valores, separators=(',', ':'))
+    return base64.urlsafe_b64encode(texto.encode()).decode().rstrip('=')
+
+
+def decodificar_cursor(cursor, columnas):
+    """Devuelve la tupla de valores del cursor, o None si no es válido."""
+    try:
+        relleno = '=' * (-len(cursor) % 4)
+        valores = json.loads(base64.urlsafe_b64decode(cursor + relleno))
+        if len(valores) != len(columnas):
+            return None
+        return tuple(
+            datetime.fromisoformat(v) if columna.type.python_type is datetime else v
+            for v, columna in zip(valores, columnas)
+        )
+    except (ValueError, TypeError):
+        return None
+
+
+def paginar_por_cursor(query, columnas, despues=None, antes=None, por_pagina=50, descendente=True):
+    """Pagina `query` por las `columnas` (la última debe ser única, normalmente el id).
+
+    En lugar de OFFSET se filtra por los valores de la última fila vista, así que
+    cualquier página cuesta lo mismo que la primera si existe un índice sobre las columnas.
+    `despues` avanza a partir de un cursor; `antes` retrocede hasta él.
+    """
+    clave = tuple_(*columnas)
+    hacia_atras = antes is not None
+    cursor = decodificar_cursor(antes if hacia_atras else despues, columnas) if (antes or despues) else None
+
+    #Retroceder equivale a recorrer en el orden inverso y dar la vuelta al resultado
+    orden_descendente = descendente != hacia_atras
+    if cursor is not None:
+        query = query.filter(clave < tuple_(*cursor) if orden_descendente else clave > tuple_(*cursor))
+    orden = [c.desc() if orden_descendente else c.asc() for c in columnas]
+    filas = query.order_by(*orden).limit(por_pagina + 1).all()
+
+    hay_mas = len(filas) > por_pagina
+    filas = filas[:por_pagina]
+    if hacia_atras:
+        filas.reverse()
+
+    def cursor_de(fila):
+        return codificar_cursor([getattr(fila, c.key) for c in columnas])
+
+    cursor_anterior = cursor_siguiente = None
+    if filas:
+        if hacia_atras:
+            cursor_anterior = cursor_de(filas[0]) if hay_mas else None
+            cursor_siguiente = cursor_de(filas[-1]) if cursor is not None else None
+        else:
+            cursor_anterior = cursor_de(filas[0]) if cursor is not None else None
+            cursor_siguiente = cursor_de(filas[-1]) if hay_mas else None
+
+    return PaginaCursor(filas, cursor_anterior, cursor_siguiente)
@@ -0,0 +1,166 @@
+from datetime import datetime, timedelta
+from sqlalchemy import event, func, delete, insert, select, inspect, text
+from app import db
+from app.models.venta import Venta
+from app.models.venta_producto import VentaProducto
+from app.models.pago import Pago
+from app.models.gasto import Gasto
+from app.models.devolucion import Devolucion
+from app.models.resumen_diario import ResumenVentaDiaria, ResumenProductoDiario, ResumenGastoDiario
+
+#Clave en session.info donde se acumulan los días/ventas tocados durante la transacción
+_CLAVE_PENDIENTES = 'resumenes_pendientes'
+
+#Primer número de los bloqueos consultivos de PostgreSQL con los que se serializa la reconstrucción de un día
+_BLOQUEO_RESUMENES = 7301
+
+
+def _bloquear_dia(session, dia):
+    """Serializa la reconstrucción de `dia` entre transacciones concurrentes (PostgreSQL).
+
+    El bloqueo dura hasta el final de la transacción: quien espera lo obtiene cuando el otro ya ha
+    confirmado, y con READ COMMITTED sus consultas ven esos cambios. SQLite ya serializa las escrituras.
+    """
+    if session.get_bind().dialect.name == 'postgresql':
+        session.execute(text('SELECT pg_advisory_xact_lock(:clase, :dia)'),
+                        {'clase': _BLOQUEO_RESUMENES, 'dia': dia.toordinal()})
+
+
+def _reconstruir_ventas(session, desde, hasta, inicio, fin):
+    for modelo in (ResumenVentaDiaria, ResumenProductoDiario):
+        tabla = modelo.__table__
+        session.execute(delete(tabla).where(tabla.c.dia >= desde, tabla.c.dia <= hasta))
+
+    dia_venta = func.date(Venta.fecha_venta, type_=db.Date)
+    ventas = session.execute(
+        select(dia_venta, Venta.estado, func.count(Venta.id), func.sum(Venta.monto_total))
+        .where(Venta.fecha_venta >= inicio, Venta.fecha_venta < fin)
+        .group_by(dia_venta, Venta.estado)
+    ).all()
+    if ventas:
+        session.execute(insert(ResumenVentaDiaria.__table__), [
+            {'dia': dia, 'estado': estado, 'numero_ventas': numero, 'monto_total': monto or 0}
+            for dia, estado, numero, monto in ventas
+        ])
+
+    productos = session.execute(
+        select(dia_venta, Venta.estado, VentaProducto.producto_id, func.sum(VentaProducto.cantidad))
+        .join(Venta, VentaProducto.venta_id == Venta.id)
+        .where(Venta.fecha_venta >= inicio, Venta.fecha_venta < fin)
+        .group_by(dia_venta, Venta.estado, VentaProducto.producto_id)
+    ).all()
+    if productos:
+        session.execute(insert(ResumenProductoDiario.__table__), [
+            {'dia': dia, 'estado': estado, 'producto_id': producto_id, 'cantidad': cantidad or 0}
+            for dia, estado, producto_id, cantidad in productos
+        ])
+
+
+def _reconstruir_gastos(session, desde, hasta, inicio, fin):
+    tabla = ResumenGastoDiario.__table__
+    session.execute(delete(tabla).where(tabla.c.dia >= desde, tabla.c.dia <= hasta))
+
+    dia_gasto = func.date(Gasto.fecha, type_=db.Date)
+    gastos = session.execute(
+        select(dia_gasto, Gasto.categoria_id, func.count(Gasto.id), func.sum(Gasto.monto))
+        .where(Gasto.fecha >= inicio, Gasto.fecha < fin)
+        .group_by(dia_gasto, Gasto.categoria_id)
+    ).all()
+    if gastos:
+        session.execute(insert(tabla), [
+            {'dia': dia, 'categoria_id': categoria_id, 'numero_gastos': numero, 'monto_total': monto or 0}
+            for dia, categoria_id, numero, monto in gastos
+        ])
+
+
+def reconstruir_resumenes(session, desde, hasta, ventas=True, gastos=True):
+    """Recalcula los resúmenes de los días entre `desde` y `hasta` (ambos incluidos): los de ventas y
+    productos, los de gastos o ambos.
+    """
+    inicio = datetime.combine(desde, datetime.min.time())
+    fin = datetime.combine(hasta, datetime.min.time()) + timedelta(days=1)
+    if ventas:
+        _reconstruir_ventas(session, desde, hasta, inicio, fin)
+    if gastos:
+        _reconstruir_gastos(session, desde, hasta, inicio, fin)
+
+
+def _fechas_afectadas(obj, atributo):
+    """Fecha actual y, si cambió en este flush, la anterior."""
+    fechas = [h for h in inspect(obj).attrs[atributo].history.deleted if h]
+    actual = getattr(obj, atributo)
+    if actual:
+        fechas.append(actual)
+    return fechas
+
+
+def _registrar_cambios(session, flush_context):
+    pendientes = session.info.setdefault(_CLAVE_PENDIENTES, {'dias_ventas': set(), 'dias_gastos': set(), 'ventas': set()})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Venta):
+            pendientes['dias_ventas'].update(f.date() for f in _fechas_afectadas(obj, 'fecha_venta'))
+            if obj.id is not None:
+                pendientes['ventas'].add(obj.id)
+        elif isinstance(obj, (VentaProducto, Pago, Devolucion)):
+            if obj.venta_id is not None:
+                pendientes['ventas'].add(obj.venta_id)
+        elif isinstance(obj, Gasto):
+            fechas = _fechas_afectadas(obj, 'fecha') or [datetime.utcnow()]
+            pendientes['dias_gastos'].update(f.date() for f in fechas)
+
+
+def _registrar_sentencia(orm_execute_state):
+    """UPDATE/DELETE masivos (p. ej. query.delete()) no pasan por el flush: antes de ejecutarlos se
+    consultan las ventas y días de las filas a las que afectan."""
+    if not (orm_execute_state.is_update or orm_execute_state.is_delete):
+        return
+    tabla = getattr(orm_execute_state.statement, 'table', None)
+    condicion = orm_execute_state.statement.whereclause
+    session = orm_execute_state.session
+    pendientes = session.info.setdefault(_CLAVE_PENDIENTES, {'dias_ventas': set(), 'dias_gastos': set(), 'ventas': set()})
+
+    def afectadas(*columnas):
+        consulta = select(*columnas)
+        return session.execute(consulta if condicion is None else consulta.where(condicion))
+
+    if tabla is Venta.__table__:
+        filas = afectadas(Venta.id, Venta.fecha_venta).all()
+        pendientes['ventas'].update(venta_id for venta_id, _ in filas)
+        pendientes['dias_ventas'].update(fecha.date() for _, fecha in filas if fecha)
+    elif tabla in (VentaProducto.__table__, Pago.__table__, Devolucion.__table__):
+        pendientes['ventas'].update(afectadas(tabla.c.venta_id).scalars())
+    elif tabla is Gasto.__table__:
+        pendientes['dias_gastos'].update(fecha.date() for fecha in afectadas(Gasto.fecha).scalars() if fecha)
+
+
+def _actualizar_resumenes(session):
+    #El commit aún no ha hecho su último flush; lo forzamos para conocer todos los cambios
+    session.flush()
+    pendientes = session.info.pop(_CLAVE_PENDIENTES, None)
+    if not pendientes:
+        return
+
+    dias_ventas = set(pendientes['dias_ventas'])
+    if pendientes['ventas']:
+        fechas = session.execute(
+            select(Venta.fecha_venta).where(Venta.id.in_(pendientes['ventas']))
+        ).scalars()
+        dias_ventas.update(f.date() for f in fechas if f)
+
+    #Siempre en el mismo orden: dos transacciones que tocan los mismos días no pueden bloquearse mutuamente
+    for dia in sorted(dias_ventas | pendientes['dias_gastos']):
+        _bloquear_dia(session, dia)
+        reconstruir_resumenes(session, dia, dia, ventas=dia in dias_ventas, gastos=dia in pendientes['dias_gastos'])
+
+
+def _descartar_pendientes(session):
+    session.info.pop(_CLAVE_PENDIENTES, None)
+
+
+def init_app(app):
+    for nombre, funcion in (('after_flush', _registrar_cambios),
+                            ('do_orm_execute', _registrar_sentencia),
+                            ('before_commit', _actualizar_resumenes),
+                            ('after_rollback', _descartar_pendientes)):
+        if not event.contains(db.session, nombre, funcion):
+            event.listen(db.session, nombre, funcion)
@@ -0,0 +1,99 @@
+from decimal import Decimal
+from sqlalchemy import event, func, select, inspect
+from sqlalchemy.sql import ClauseElement
+from app import db
+from app.models.venta import Venta
+from app.models.pago import Pago
+
+
+def _decimal(valor):
+    return Decimal(str(valor or 0))
+
+
+def _venta_de_pago(session, pago, venta_id):
+    venta = pago.__dict__.get('venta')
+    if venta is None and venta_id is not None:
+        venta = session.get(Venta, venta_id)
+    return venta
+
+
+def _variaciones_de_pagos(session):
+    """Cambio en el total pagado de cada venta según los pagos añadidos, modificados o eliminados."""
+    variaciones = {}
+
+    def sumar(venta, monto):
+        if venta is not None and monto:
+            variaciones[venta] = variaciones.get(venta, Decimal('0')) + monto
+
+    for pago in session.new:
+        if isinstance(pago, Pago):
+            sumar(_venta_de_pago(session, pago, pago.venta_id), _decimal(pago.monto_pago))
+
+    for pago in session.deleted:
+        if isinstance(pago, Pago):
+            estado = inspect(pago)
+            monto = estado.attrs.monto_pago.history.unchanged or estado.attrs.monto_pago.history.deleted or [0]
+            sumar(_venta_de_pago(session, pago, pago.venta_id), -_decimal(monto[0]))
+
+    for pago in session.dirty:
+        if isinstance(pago, Pago):
+            estado = inspect(pago)
+            hist_monto = estado.attrs.monto_pago.history
+            hist_venta = estado.attrs.venta_id.history
+            if not hist_monto.has_changes() and not hist_venta.has_changes():
+                continue
+            monto_anterior = _decimal((hist_monto.deleted or hist_monto.unchanged or [0])[0])
+            venta_anterior = (hist_venta.deleted or hist_venta.unchanged or [None])[0]
+            sumar(_venta_de_pago(session, pago, venta_anterior) if hist_venta.has_changes() else
+                  _venta_de_pago(session, pago, pago.venta_id), -monto_anterior)
+            sumar(_venta_de_pago(session, pago, pago.venta_id), _decimal(pago.monto_pago))
+
+    return variaciones
+
+
+def _actualizar_saldos(session, flush_context, instances):
+    variaciones = _variaciones_de_pagos(session)
+    for venta in session.dirty:
+        if isinstance(venta, Venta) and inspect(venta).attrs.monto_total.history.has_changes():
+            variaciones.setdefault(venta, Decimal('0'))
+
+    for venta, variacion in variaciones.items():
+        if venta in session.new:
+            #Venta nueva: aún no hay fila, los valores se calculan en Python
+            venta.total_pagado = _decimal(venta.total_pagado) + variacion
+            venta.saldo_pendiente = _decimal(venta.monto_total) - venta.total_pagado
+            continue
+
+        #Incrementos en SQL: dos pagos simultáneos sobre la misma venta no se pisan.
+        #En el UPDATE, las columnas de la derecha valen lo que valían antes de la sentencia.
+        monto_total = venta.monto_total
+        if not isinstance(monto_total, ClauseElement) and not inspect(venta).attrs.monto_total.history.has_changes():
+            monto_total = Venta.monto_total
+        nuevo_total_pagado = Venta.total_pagado + variacion
+        venta.total_pagado = nuevo_total_pagado
+        venta.saldo_pendiente = monto_total - nuevo_total_pagado
+
+
+def saldos_descuadrados(session):
+    """Ventas cuyas columnas total_pagado/saldo_pendiente no coinciden con sus pagos.
+
+    Devuelve tuplas (venta_id, total_pagado, saldo_pendiente, total_real, saldo_real).
+    """
+    pagos = (
+        select(Pago.venta_id, func.sum(Pago.monto_pago).label('total'))
+        .group_by(Pago.venta_id)
+        .subquery()
+    )
+    total_real = func.coalesce(pagos.c.total, 0)
+    saldo_real = Venta.monto_total - total_real
+    return session.execute(
+        select(Venta.id, Venta.total_pagado, Venta.saldo_pendiente, total_real, saldo_real)
+        .outerjoin(pagos, pagos.c.venta_id == Venta.id)
+        .where((Venta.total_pagado != total_real) | (Venta.saldo_pendiente != saldo_real))
+        .order_by(Venta.id)
+    ).all()
+
+
+def init_app(app):
+    if not event.contains(db.session, 'before_flush', _actualizar_saldos):
+        event.listen(db.session, 'before_flush', _actualizar_saldos)
@@ -8,4 +8,24 @@ load_dotenv(os.path.join(basedir, '.env'))
 class Config:
     SECRET_KEY = os.environ.get('SECRET_KEY')
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL')
-    SQLALCHEMY_TRACK_MODIFICATIONS = False
\ No newline at end of file
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    #Segundos que un widget del dashboard puede servirse desde la caché de cada proceso
+    CACHE_DASHBOARD_TTL = int(os.environ.get('CACHE_DASHBOARD_TTL', 60))
+    #Segundos que un proceso reutiliza la identidad del usuario sin consultar la base de datos; pasado ese tiempo
+    #comprueba su versión, así que es también lo que tarda en aplicarse en otros workers un bloqueo o cambio de rol
+    CACHE_USUARIOS_TTL = int(os.environ.get('CACHE_USUARIOS_TTL', 30))
+    #Cuenta consultas y tiempo de base de datos por petición (cabecera X-SQL-Stats y log)
+    SQL_INSTRUMENTACION = os.environ.get('SQL_INSTRUMENTACION', '').lower() in ('1', 'true', 'si')
+    #Veces que se debe repetir una misma consulta en una petición para señalarla como posible N+1
+    SQL_INSTRUMENTACION_UMBRAL = int(os.environ.get('SQL_INSTRUMENTACION_UMBRAL', 5))
+    #Almacenamiento de los atributos de producto: 'eav' (filas en valor_atributo_producto), 'dual' (escribe
+    #en ambos y lee de producto.atributos_json, para la transición) o 'json' (solo producto.atributos_json)
+    ATRIBUTOS_ALMACENAMIENTO = os.environ.get('ATRIBUTOS_ALMACENAMIENTO', 'eav').lower()
+    #Procesos dedicados a generar recibos, facturas y planes de pago (0 = en la propia petición). Son por
+    #worker de gunicorn: en total hay workers × DOCUMENTOS_PROCESOS, cada uno con WeasyPrint cargado
+    DOCUMENTOS_PROCESOS = int(os.environ.get('DOCUMENTOS_PROCESOS', 2))
+    #Formato de recibos, facturas y planes de pago: 'png' (imagen para vista previa y compartir) o 'pdf'
+    #(se envía directamente desde memoria, sin rasterizar ni guardar en disco). ?formato= lo cambia por petición
+    DOCUMENTOS_FORMATO = os.environ.get('DOCUMENTOS_FORMATO', 'png').lower()
+    #Resolución de las imágenes PNG; menos puntos por pulgada = rasterizado más rápido y archivos más ligeros
+    DOCUMENTOS_PNG_DPI = int(os.environ.get('DOCUMENTOS_PNG_DPI', 200))
\ No newline at end of file
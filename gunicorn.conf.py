@@ -0,0 +1,7 @@
+#Configuración de gunicorn; se lee automáticamente desde el directorio de trabajo (/app en el contenedor)
+
+
+def post_worker_init(worker):
+    #Arranca el pool de documentos del worker al iniciar, no con el primer recibo que se pide
+    from app.utils import documentos
+    documentos.iniciar_pool(worker.wsgi)
@@ -0,0 +1,73 @@
+"""Tablas de resumen diario para el dashboard
+
+Revision ID: 291059e1e875
+Revises: 0a8e2111d7e4
+Create Date: 2026-10-18 09:12:40.118230
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '291059e1e875'
+down_revision = '0a8e2111d7e4'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('resumen_venta_diaria',
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('numero_ventas', sa.Integer(), nullable=False),
+    sa.Column('monto_total', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('dia', 'estado')
+    )
+    op.create_table('resumen_producto_diario',
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('estado', sa.String(length=20), nullable=False),
+    sa.Column('producto_id', sa.Integer(), nullable=False),
+    sa.Column('cantidad', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('dia', 'estado', 'producto_id')
+    )
+    with op.batch_alter_table('resumen_producto_diario', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_resumen_producto_diario_producto_id'), ['producto_id'], unique=False)
+
+    op.create_table('resumen_gasto_diario',
+    sa.Column('dia', sa.Date(), nullable=False),
+    sa.Column('categoria_id', sa.Integer(), nullable=False),
+    sa.Column('numero_gastos', sa.Integer(), nullable=False),
+    sa.Column('monto_total', sa.Numeric(precision=12, scale=2), nullable=False),
+    sa.PrimaryKeyConstraint('dia', 'categoria_id')
+    )
+    # Carga del historial, con la misma agregación que `flask reconstruir-resumenes`; sin esto el
+    # dashboard mostraría 0 en todos los días anteriores al despliegue
+    op.execute(
+        'INSERT INTO resumen_venta_diaria (dia, estado, numero_ventas, monto_total) '
+        'SELECT date(fecha_venta), estado, count(id), coalesce(sum(monto_total), 0) '
+        'FROM venta WHERE fecha_venta IS NOT NULL '
+        'GROUP BY date(fecha_venta), estado'
+    )
+    op.execute(
+        'INSERT INTO resumen_producto_diario (dia, estado, producto_id, cantidad) '
+        'SELECT date(venta.fecha_venta), venta.estado, venta_producto.producto_id, coalesce(sum(venta_producto.cantidad), 0) '
+        'FROM venta_producto JOIN venta ON venta_producto.venta_id = venta.id '
+        'WHERE venta.fecha_venta IS NOT NULL '
+        'GROUP BY date(venta.fecha_venta), venta.estado, venta_producto.producto_id'
+    )
+    op.execute(
+        'INSERT INTO resumen_gasto_diario (dia, categoria_id, numero_gastos, monto_total) '
+        'SELECT date(fecha), categoria_id, count(id), coalesce(sum(monto), 0) '
+        'FROM gasto WHERE fecha IS NOT NULL '
+        'GROUP BY date(fecha), categoria_id'
+    )
+
+
+def downgrade():
+    op.drop_table('resumen_gasto_diario')
+    with op.batch_alter_table('resumen_producto_diario', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_resumen_producto_diario_producto_id'))
+
+    op.drop_table('resumen_producto_diario')
+    op.drop_table('resumen_venta_diaria')
@@ -0,0 +1,38 @@
+"""Índices trigram para buscar productos
+
+Revision ID: 3f8d61a0c2b7
+Revises: e5b0c7d2a914
+Create Date: 2026-10-18 18:21:09.530118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f8d61a0c2b7'
+down_revision = 'e5b0c7d2a914'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    #Los índices gin_trgm_ops necesitan la extensión pg_trgm; en otros motores son índices normales
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.create_index('ix_producto_nombre_trgm', ['nombre'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'nombre': 'gin_trgm_ops'})
+
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.create_index('ix_valor_atributo_producto_valor_trgm', ['valor'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'valor': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_valor_atributo_producto_valor_trgm')
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_producto_nombre_trgm')
@@ -0,0 +1,49 @@
+"""Atributos de producto en JSON
+
+Revision ID: 4d7a1c8e5b92
+Revises: b6a2f9e3d415
+Create Date: 2026-10-18 21:04:12.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '4d7a1c8e5b92'
+down_revision = 'b6a2f9e3d415'
+branch_labels = None
+depends_on = None
+
+
+def _tipo_json():
+    return sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), 'postgresql')
+
+
+def upgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('atributos_json', _tipo_json(), nullable=True))
+
+    #Copiar los valores actuales de valor_atributo_producto: {"<atributo_id>": "valor", ...}
+    bind = op.get_bind()
+    filas = bind.execute(sa.text('SELECT producto_id, atributo_id, valor FROM valor_atributo_producto'))
+    datos = {producto_id: {} for producto_id in bind.execute(sa.text('SELECT id FROM producto')).scalars()}
+    for producto_id, atributo_id, valor in filas:
+        datos[producto_id][str(atributo_id)] = valor
+    if datos:
+        producto = sa.table('producto', sa.column('id', sa.Integer), sa.column('atributos_json', _tipo_json()))
+        bind.execute(
+            producto.update().where(producto.c.id == sa.bindparam('producto_id')).values(atributos_json=sa.bindparam('datos')),
+            [{'producto_id': producto_id, 'datos': valores} for producto_id, valores in datos.items()]
+        )
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.create_index('ix_producto_atributos_json', ['atributos_json'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'atributos_json': 'jsonb_path_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_producto_atributos_json')
+        batch_op.drop_column('atributos_json')
@@ -0,0 +1,41 @@
+"""Índices de búsqueda de clientes
+
+Revision ID: 5b9e2d4a7c13
+Revises: 8e3b5d1f7a26
+Create Date: 2026-10-18 21:58:06.731542
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e2d4a7c13'
+down_revision = '8e3b5d1f7a26'
+branch_labels = None
+depends_on = None
+
+_NOMBRE_COMPLETO = "(nombre || ' ' || coalesce(apellido, ''))"
+
+
+def upgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.create_index('ix_cliente_identificacion_prefijo', ['identificacion'], unique=False,
+                              postgresql_ops={'identificacion': 'varchar_pattern_ops'})
+        batch_op.create_index('ix_cliente_telefono_prefijo', ['telefono'], unique=False,
+                              postgresql_ops={'telefono': 'varchar_pattern_ops'})
+
+    #Índice trigram sobre la misma expresión que Cliente.nombre_completo; en otros motores, índice normal
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        op.execute(f'CREATE INDEX ix_cliente_nombre_completo_trgm ON cliente USING gin ({_NOMBRE_COMPLETO} gin_trgm_ops)')
+    else:
+        op.create_index('ix_cliente_nombre_completo_trgm', 'cliente', [sa.text(_NOMBRE_COMPLETO)], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cliente_nombre_completo_trgm', table_name='cliente')
+
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_index('ix_cliente_telefono_prefijo')
+        batch_op.drop_index('ix_cliente_identificacion_prefijo')
@@ -0,0 +1,26 @@
+"""Versión de usuario
+
+Revision ID: 6c2f8a4e1d37
+Revises: a2f6c9e1d574
+Create Date: 2026-10-18 23:12:05.418203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '6c2f8a4e1d37'
+down_revision = 'a2f6c9e1d574'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('usuario', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('usuario', schema=None) as batch_op:
+        batch_op.drop_column('version')
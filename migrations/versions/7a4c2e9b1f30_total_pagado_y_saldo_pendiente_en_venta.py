@@ -0,0 +1,39 @@
+"""Total pagado y saldo pendiente en venta
+
+Revision ID: 7a4c2e9b1f30
+Revises: d8ff505fe720
+Create Date: 2026-10-18 17:20:12.481337
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7a4c2e9b1f30'
+down_revision = 'd8ff505fe720'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('venta', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('total_pagado', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('saldo_pendiente', sa.Numeric(precision=10, scale=2), nullable=False, server_default='0'))
+
+    #Rellenar con los pagos existentes
+    op.execute("""
+        UPDATE venta SET total_pagado = COALESCE(
+            (SELECT SUM(pago.monto_pago) FROM pago WHERE pago.venta_id = venta.id), 0)
+    """)
+    op.execute("UPDATE venta SET saldo_pendiente = monto_total - total_pagado")
+
+    with op.batch_alter_table('venta', schema=None) as batch_op:
+        batch_op.create_index('ix_venta_saldo_pendiente', ['saldo_pendiente'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('venta', schema=None) as batch_op:
+        batch_op.drop_index('ix_venta_saldo_pendiente')
+        batch_op.drop_column('saldo_pendiente')
+        batch_op.drop_column('total_pagado')
@@ -0,0 +1,28 @@
+"""Índice de prefijo del nombre de cliente
+
+Revision ID: 7d3a9f2c4b18
+Revises: 6c2f8a4e1d37
+Create Date: 2026-10-18 23:48:31.207915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d3a9f2c4b18'
+down_revision = '6c2f8a4e1d37'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    #lower(nombre) LIKE 'texto%' del listado de clientes; ILIKE no puede usar un índice btree normal
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE INDEX ix_cliente_nombre_prefijo ON cliente (lower(nombre) text_pattern_ops)')
+    else:
+        op.create_index('ix_cliente_nombre_prefijo', 'cliente', [sa.text('lower(nombre)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_cliente_nombre_prefijo', table_name='cliente')
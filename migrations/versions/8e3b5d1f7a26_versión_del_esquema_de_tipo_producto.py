@@ -0,0 +1,26 @@
+"""Versión del esquema de tipo_producto
+
+Revision ID: 8e3b5d1f7a26
+Revises: 4d7a1c8e5b92
+Create Date: 2026-10-18 21:32:48.207164
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e3b5d1f7a26'
+down_revision = '4d7a1c8e5b92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('tipo_producto', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version_esquema', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('tipo_producto', schema=None) as batch_op:
+        batch_op.drop_column('version_esquema')
@@ -0,0 +1,57 @@
+"""Etiqueta de atributos en producto
+
+Revision ID: 9c1e4b7d2f60
+Revises: 3f8d61a0c2b7
+Create Date: 2026-10-18 18:47:33.104862
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c1e4b7d2f60'
+down_revision = '3f8d61a0c2b7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('etiqueta_atributos', sa.Text(), nullable=True))
+
+    #Rellenar las etiquetas con los valores actuales ("Atributo: valor, ...", en el orden de los atributos)
+    bind = op.get_bind()
+    filas = bind.execute(sa.text("""
+        SELECT v.producto_id, a.nombre_atributo, v.valor
+        FROM valor_atributo_producto v JOIN atributo a ON a.id = v.atributo_id
+        ORDER BY v.producto_id, a.id
+    """))
+    etiquetas = {}
+    for producto_id, nombre_atributo, valor in filas:
+        etiquetas.setdefault(producto_id, []).append(f'{nombre_atributo}: {valor}')
+    if etiquetas:
+        bind.execute(
+            sa.text('UPDATE producto SET etiqueta_atributos = :etiqueta WHERE id = :id'),
+            [{'id': producto_id, 'etiqueta': ', '.join(partes)} for producto_id, partes in etiquetas.items()]
+        )
+
+    #La búsqueda pasa a hacerse sobre la etiqueta precalculada en lugar de sobre cada valor
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_valor_atributo_producto_valor_trgm')
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.create_index('ix_producto_etiqueta_atributos_trgm', ['etiqueta_atributos'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'etiqueta_atributos': 'gin_trgm_ops'})
+
+
+def downgrade():
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_producto_etiqueta_atributos_trgm')
+
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.create_index('ix_valor_atributo_producto_valor_trgm', ['valor'], unique=False,
+                              postgresql_using='gin', postgresql_ops={'valor': 'gin_trgm_ops'})
+
+    with op.batch_alter_table('producto', schema=None) as batch_op:
+        batch_op.drop_column('etiqueta_atributos')
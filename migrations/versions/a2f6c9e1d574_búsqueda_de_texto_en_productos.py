@@ -0,0 +1,80 @@
+"""Búsqueda de texto en productos
+
+Revision ID: a2f6c9e1d574
+Revises: 5b9e2d4a7c13
+Create Date: 2026-10-18 22:26:41.918273
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2f6c9e1d574'
+down_revision = '5b9e2d4a7c13'
+branch_labels = None
+depends_on = None
+
+#Columnas indexadas: nombre, descripción y la etiqueta de atributos que mantiene app.utils.etiquetas
+_CAMPOS = 'nombre, descripcion, etiqueta_atributos'
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        #Configuración "spanish" que además ignora las tildes
+        op.execute('CREATE EXTENSION IF NOT EXISTS unaccent')
+        op.execute('CREATE TEXT SEARCH CONFIGURATION es_sin_tildes (COPY = spanish)')
+        op.execute('ALTER TEXT SEARCH CONFIGURATION es_sin_tildes '
+                   'ALTER MAPPING FOR hword, hword_part, word WITH unaccent, spanish_stem')
+        #Columna generada: PostgreSQL la recalcula en cada INSERT/UPDATE, sin triggers ni código en la app
+        op.execute("""
+            ALTER TABLE producto ADD COLUMN busqueda tsvector GENERATED ALWAYS AS (
+                setweight(to_tsvector('es_sin_tildes', coalesce(nombre, '')), 'A') ||
+                setweight(to_tsvector('es_sin_tildes', coalesce(etiqueta_atributos, '')), 'B') ||
+                setweight(to_tsvector('es_sin_tildes', coalesce(descripcion, '')), 'C')
+            ) STORED
+        """)
+        op.execute('CREATE INDEX ix_producto_busqueda ON producto USING gin (busqueda)')
+
+    elif bind.dialect.name == 'sqlite':
+        #Sin FTS5 compilado, la aplicación busca con LIKE
+        if not bind.execute(sa.text("SELECT sqlite_compileoption_used('ENABLE_FTS5')")).scalar():
+            return
+        #Tabla FTS5 de contenido externo (lee el texto de producto) sincronizada con triggers.
+        #Ojo: un batch_alter_table posterior sobre producto recrea la tabla y elimina estos triggers
+        op.execute(f"""
+            CREATE VIRTUAL TABLE producto_fts USING fts5(
+                {_CAMPOS}, content='producto', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+            )
+        """)
+        op.execute(f"""
+            CREATE TRIGGER producto_fts_ai AFTER INSERT ON producto BEGIN
+                INSERT INTO producto_fts(rowid, {_CAMPOS}) VALUES (new.id, new.nombre, new.descripcion, new.etiqueta_atributos);
+            END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER producto_fts_ad AFTER DELETE ON producto BEGIN
+                INSERT INTO producto_fts(producto_fts, rowid, {_CAMPOS}) VALUES ('delete', old.id, old.nombre, old.descripcion, old.etiqueta_atributos);
+            END
+        """)
+        op.execute(f"""
+            CREATE TRIGGER producto_fts_au AFTER UPDATE OF {_CAMPOS} ON producto BEGIN
+                INSERT INTO producto_fts(producto_fts, rowid, {_CAMPOS}) VALUES ('delete', old.id, old.nombre, old.descripcion, old.etiqueta_atributos);
+                INSERT INTO producto_fts(rowid, {_CAMPOS}) VALUES (new.id, new.nombre, new.descripcion, new.etiqueta_atributos);
+            END
+        """)
+        op.execute("INSERT INTO producto_fts(producto_fts) VALUES ('rebuild')")
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ix_producto_busqueda')
+        op.execute('ALTER TABLE producto DROP COLUMN IF EXISTS busqueda')
+        op.execute('DROP TEXT SEARCH CONFIGURATION IF EXISTS es_sin_tildes')
+
+    elif bind.dialect.name == 'sqlite':
+        for trigger in ('producto_fts_au', 'producto_fts_ad', 'producto_fts_ai'):
+            op.execute(f'DROP TRIGGER IF EXISTS {trigger}')
+        op.execute('DROP TABLE IF EXISTS producto_fts')
@@ -0,0 +1,28 @@
+"""Índices compuestos de valor_atributo_producto
+
+Revision ID: b6a2f9e3d415
+Revises: 9c1e4b7d2f60
+Create Date: 2026-10-18 19:12:05.877213
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6a2f9e3d415'
+down_revision = '9c1e4b7d2f60'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.create_index('ix_valor_atributo_producto_atributo_id_valor', ['atributo_id', 'valor', 'producto_id'], unique=False)
+        batch_op.create_index('ix_valor_atributo_producto_producto_id_atributo_id', ['producto_id', 'atributo_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('valor_atributo_producto', schema=None) as batch_op:
+        batch_op.drop_index('ix_valor_atributo_producto_producto_id_atributo_id')
+        batch_op.drop_index('ix_valor_atributo_producto_atributo_id_valor')
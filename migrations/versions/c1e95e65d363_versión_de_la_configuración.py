@@ -0,0 +1,26 @@
+"""Versión de la configuración
+
+Revision ID: c1e95e65d363
+Revises: 291059e1e875
+Create Date: 2026-10-18 10:03:51.672018
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1e95e65d363'
+down_revision = '291059e1e875'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('configuracion', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='1'))
+
+
+def downgrade():
+    with op.batch_alter_table('configuracion', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,52 @@
+"""Índices para paginación por cursor
+
+Revision ID: d8ff505fe720
+Revises: c1e95e65d363
+Create Date: 2026-10-18 11:20:07.448391
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8ff505fe720'
+down_revision = 'c1e95e65d363'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('venta', schema=None) as batch_op:
+        batch_op.create_index('ix_venta_fecha_venta_id', ['fecha_venta', 'id'], unique=False)
+        batch_op.create_index('ix_venta_estado_fecha_venta_id', ['estado', 'fecha_venta', 'id'], unique=False)
+        batch_op.create_index('ix_venta_cliente_id_fecha_venta_id', ['cliente_id', 'fecha_venta', 'id'], unique=False)
+
+    with op.batch_alter_table('gasto', schema=None) as batch_op:
+        batch_op.create_index('ix_gasto_fecha_id', ['fecha', 'id'], unique=False)
+        batch_op.create_index('ix_gasto_categoria_id_fecha_id', ['categoria_id', 'fecha', 'id'], unique=False)
+
+    with op.batch_alter_table('devolucion', schema=None) as batch_op:
+        batch_op.create_index('ix_devolucion_fecha_devolucion_id', ['fecha_devolucion', 'id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_devolucion_venta_id'), ['venta_id'], unique=False)
+
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.create_index('ix_cliente_nombre_id', ['nombre', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('cliente', schema=None) as batch_op:
+        batch_op.drop_index('ix_cliente_nombre_id')
+
+    with op.batch_alter_table('devolucion', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_devolucion_venta_id'))
+        batch_op.drop_index('ix_devolucion_fecha_devolucion_id')
+
+    with op.batch_alter_table('gasto', schema=None) as batch_op:
+        batch_op.drop_index('ix_gasto_categoria_id_fecha_id')
+        batch_op.drop_index('ix_gasto_fecha_id')
+
+    with op.batch_alter_table('venta', schema=None) as batch_op:
+        batch_op.drop_index('ix_venta_cliente_id_fecha_venta_id')
+        batch_op.drop_index('ix_venta_estado_fecha_venta_id')
+        batch_op.drop_index('ix_venta_fecha_venta_id')
@@ -0,0 +1,32 @@
+"""Recalcular monto_total de ventas en proceso
+
+Revision ID: e5b0c7d2a914
+Revises: 7a4c2e9b1f30
+Create Date: 2026-10-18 17:58:40.219604
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b0c7d2a914'
+down_revision = '7a4c2e9b1f30'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    #Hasta ahora el total de una venta en proceso solo se recalculaba al abrir su página de edición;
+    #desde esta versión se mantiene al añadir o quitar productos, así que se deja cuadrado una vez
+    op.execute("""
+        UPDATE venta SET monto_total = COALESCE(
+            (SELECT SUM(venta_producto.precio_unitario * venta_producto.cantidad)
+             FROM venta_producto WHERE venta_producto.venta_id = venta.id), 0)
+        WHERE estado = 'En Proceso'
+    """)
+    op.execute("UPDATE venta SET saldo_pendiente = monto_total - total_pagado WHERE estado = 'En Proceso'")
+
+
+def downgrade():
+    pass
@@ -0,0 +1,103 @@
+import unittest
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from app import create_app, db
+from config import Config
+
+
+class TestConfig(Config):
+    TESTING = True
+    SECRET_KEY = 'test'
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    WTF_CSRF_ENABLED = False
+
+
+class ResumenesTest(unittest.TestCase):
+    """Los resúmenes que mantiene el hook de commit deben coincidir con `flask reconstruir-resumenes`."""
+
+    maxDiff = None
+
+    def setUp(self):
+        self.app = create_app(TestConfig)
+        self.contexto = self.app.app_context()
+        self.contexto.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.contexto.pop()
+
+    def _resumenes(self):
+        from app.models.resumen_diario import ResumenVentaDiaria, ResumenProductoDiario, ResumenGastoDiario
+
+        db.session.expire_all()
+        return {
+            'ventas': sorted((r.dia, r.estado, r.numero_ventas, Decimal(r.monto_total))
+                             for r in ResumenVentaDiaria.query),
+            'productos': sorted((r.dia, r.estado, r.producto_id, r.cantidad) for r in ResumenProductoDiario.query),
+            'gastos': sorted((r.dia, r.categoria_id, r.numero_gastos, Decimal(r.monto_total))
+                             for r in ResumenGastoDiario.query),
+        }
+
+    def test_hook_coincide_con_reconstruccion(self):
+        from app.models.cliente import Cliente
+        from app.models.tipo_producto import TipoProducto
+        from app.models.producto import Producto
+        from app.models.venta import Venta
+        from app.models.venta_producto import VentaProducto
+        from app.models.gasto import Gasto
+        from app.models.categoria_gasto import CategoriaGasto
+        from app.models.usuario import Usuario
+
+        ayer = datetime.utcnow() - timedelta(days=1)
+        tipo = TipoProducto(nombre='Ropa')
+        usuario = Usuario(nombre='Ana', email='ana@example.com', rol='Administrador')
+        categoria = CategoriaGasto(nombre='Servicios')
+        cliente = Cliente(nombre='Juan')
+        db.session.add_all([tipo, usuario, categoria, cliente])
+        db.session.commit()
+        camisa = Producto(nombre='Camisa', precio=10, stock=50, tipo_producto_id=tipo.id)
+        gorra = Producto(nombre='Gorra', precio=5, stock=50, tipo_producto_id=tipo.id)
+        db.session.add_all([camisa, gorra])
+        db.session.commit()
+
+        #Varias ventas en commits separados, como en la aplicación
+        ventas = []
+        for i, (estado, fecha) in enumerate([('Pagada', ayer), ('Credito', ayer), ('Pagada', datetime.utcnow())]):
+            venta = Venta(cliente_id=cliente.id, monto_total=Decimal('10') * (i + 1), estado=estado, fecha_venta=fecha)
+            db.session.add(venta)
+            db.session.flush()
+            db.session.add(VentaProducto(venta_id=venta.id, producto_id=camisa.id, cantidad=i + 1, precio_unitario=10))
+            db.session.commit()
+            ventas.append(venta)
+        db.session.add(VentaProducto(venta_id=ventas[0].id, producto_id=gorra.id, cantidad=2, precio_unitario=5))
+        db.session.commit()
+
+        #Cambio de estado, cambio de día y eliminación
+        ventas[1].estado = 'Pagada'
+        db.session.commit()
+        ventas[2].fecha_venta = ayer - timedelta(days=1)
+        db.session.commit()
+        VentaProducto.query.filter_by(venta_id=ventas[0].id, producto_id=gorra.id).delete()
+        db.session.delete(db.session.get(VentaProducto, 1))
+        db.session.commit()
+
+        gasto = Gasto(descripcion='Luz', monto=Decimal('7.50'), fecha=ayer, categoria_id=categoria.id, usuario_id=usuario.id)
+        db.session.add(gasto)
+        db.session.add(Gasto(descripcion='Agua', monto=Decimal('3'), fecha=ayer, categoria_id=categoria.id, usuario_id=usuario.id))
+        db.session.commit()
+        gasto.fecha = datetime.utcnow()
+        db.session.commit()
+
+        mantenidos = self._resumenes()
+        self.assertTrue(mantenidos['ventas'] and mantenidos['productos'] and mantenidos['gastos'])
+
+        resultado = self.app.test_cli_runner().invoke(args=['reconstruir-resumenes'])
+        self.assertEqual(resultado.exit_code, 0, resultado.output)
+        self.assertEqual(mantenidos, self._resumenes())
+
+
+if __name__ == '__main__':
+    unittest.main()